@@ -0,0 +1,30 @@
+-- Covering indexes so the API's hot lookups (profile families/mappings, parse-pdf line matching) are index-only scans
+-- Run this script in your Supabase SQL editor
+-- CONCURRENTLY cannot run inside a transaction block; run the statements one at a time if the editor wraps them
+
+-- Families by user, carrying the id used for ordering and the family name
+CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_families_user
+ON group_bill_automation.bill_automator_families(user_id) INCLUDE (id, family);
+
+-- Mappings by family, carrying the id used for ordering and the line
+CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_fmap_family
+ON group_bill_automation.bill_automator_family_mapping(family_id) INCLUDE (id, line_id);
+
+-- The plain family_id index is now redundant
+DROP INDEX CONCURRENTLY IF EXISTS group_bill_automation.ix_group_bill_automation_bill_automator_family_mapping_family_id;
+
+-- Refresh planner statistics
+ANALYZE group_bill_automation.bill_automator_families;
+ANALYZE group_bill_automation.bill_automator_family_mapping;
+
+-- Saved lines by user, name and number for the parse-pdf existence check
+CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_lines_user_name_number
+ON group_bill_automation.bill_automator_lines(user_id, name, number) INCLUDE (id, device);
+
+ANALYZE group_bill_automation.bill_automator_lines;
+
+-- Lines by id, carrying the columns the mapping joins read (family mappings, automated processing)
+CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_lines_id_name_number
+ON group_bill_automation.bill_automator_lines(id) INCLUDE (name, number, device);
+
+ANALYZE group_bill_automation.bill_automator_lines;
@@ -0,0 +1,59 @@
+-- Add the unique constraints the API's INSERT ... ON CONFLICT upserts rely on
+-- Run this script in your Supabase SQL editor
+
+-- Point mappings of duplicate family names at the oldest family with that name
+UPDATE group_bill_automation.bill_automator_family_mapping m
+SET family_id = keep.id
+FROM group_bill_automation.bill_automator_families f
+JOIN (
+    SELECT user_id, family, MIN(id) AS id
+    FROM group_bill_automation.bill_automator_families
+    GROUP BY user_id, family
+) keep ON keep.user_id = f.user_id AND keep.family = f.family
+WHERE m.family_id = f.id AND f.id <> keep.id;
+
+-- Remove the now-unreferenced duplicate families
+DELETE FROM group_bill_automation.bill_automator_families f
+USING group_bill_automation.bill_automator_families keep
+WHERE keep.user_id = f.user_id AND keep.family = f.family AND keep.id < f.id;
+
+-- Each user can have a family name only once
+ALTER TABLE group_bill_automation.bill_automator_families
+ADD CONSTRAINT uq_bill_automator_families_user_id_family UNIQUE (user_id, family);
+
+-- Keep only the most recent emails record for each user
+DELETE FROM group_bill_automation.bill_automator_emails e
+USING group_bill_automation.bill_automator_emails newer
+WHERE newer.user_id = e.user_id AND newer.id > e.id;
+
+-- Each user has a single emails record
+ALTER TABLE group_bill_automation.bill_automator_emails
+ADD CONSTRAINT uq_bill_automator_emails_user_id UNIQUE (user_id);
+
+-- Remove repeated family/line pairs, keeping the oldest mapping
+DELETE FROM group_bill_automation.bill_automator_family_mapping m
+USING group_bill_automation.bill_automator_family_mapping keep
+WHERE keep.family_id = m.family_id AND keep.line_id = m.line_id AND keep.id < m.id;
+
+-- A line is mapped to a given family at most once
+ALTER TABLE group_bill_automation.bill_automator_family_mapping
+ADD CONSTRAINT uq_bill_automator_family_mapping_family_id_line_id UNIQUE (family_id, line_id);
+
+-- Keep only the most recent reconciliation setting for each user
+DELETE FROM group_bill_automation.bill_automator_accountwide_reconciliation r
+USING group_bill_automation.bill_automator_accountwide_reconciliation newer
+WHERE newer.user_id = r.user_id AND newer.id > r.id;
+
+-- Each user has a single reconciliation setting
+ALTER TABLE group_bill_automation.bill_automator_accountwide_reconciliation
+ADD CONSTRAINT uq_bill_automator_accountwide_reconciliation_user_id UNIQUE (user_id);
+
+-- Keep only the most recent transfer for each user and line pair
+DELETE FROM group_bill_automation.bill_automator_line_discount_transfer_adjustment t
+USING group_bill_automation.bill_automator_line_discount_transfer_adjustment newer
+WHERE newer.user_id = t.user_id AND newer.line_to_remove_from = t.line_to_remove_from
+AND newer.line_to_add_to = t.line_to_add_to AND newer.id > t.id;
+
+-- Each user has a single transfer per pair of lines
+ALTER TABLE group_bill_automation.bill_automator_line_discount_transfer_adjustment
+ADD CONSTRAINT uq_bill_automator_line_discount_transfer_user_id_lines UNIQUE (user_id, line_to_remove_from, line_to_add_to);
@@ -3,21 +3,45 @@ Simple Flask API for Verizon Family Plan Bill Automation.
 Connects directly to Supabase without ORM complexity.
 """
 
-from flask import Flask, request, jsonify, session
+from flask import Flask, Request, request, jsonify, session
+from flask.json.provider import JSONProvider
 from flask_cors import CORS
 from flask_session import Session
+from flask_session.sessions import RedisSessionInterface
+from flask_limiter import Limiter
+from flask_limiter.util import get_remote_address
 import os
+import atexit
+import hashlib
+import hmac
+import logging
+import threading
+import orjson
 import psycopg2
+import psycopg2.extensions
+import redis
+from psycopg2.extras import RealDictCursor, execute_values
+from psycopg2.pool import PoolError, ThreadedConnectionPool
 import bcrypt
 import jwt
 from datetime import datetime, timedelta
+from decimal import Decimal
 from dotenv import load_dotenv
 from services.pdf_service import PDFService
-from parse_verizon import extract_charges_from_pdf
+from services.email_queue import send_bill_email
+from parse_verizon import extract_charges_from_pdf, valid_email
+from collections import OrderedDict, defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from io import BytesIO
+from tempfile import NamedTemporaryFile
 from functools import wraps
 
 load_dotenv()
 
+# Route debug output goes through logging so it costs nothing unless LOG_LEVEL=DEBUG
+logging.basicConfig(level=os.getenv('LOG_LEVEL', 'INFO'))
+
 # JWT helper functions
 def create_jwt_token(user_id, email):
     """Create a JWT token for the user."""
@@ -60,13 +84,82 @@ def require_auth(f):
         return f(*args, **kwargs)
     return decorated_function
 
+# Helper function for types orjson does not serialize natively
+def _json_default(obj):
+    """Serialize NUMERIC values as strings, matching Flask's default JSON provider."""
+    if isinstance(obj, Decimal):
+        return str(obj)
+    raise TypeError(f"Object of type {type(obj).__name__} is not JSON serializable")
+
+class OrjsonProvider(JSONProvider):
+    """JSON provider backed by orjson; datetimes are emitted as ISO 8601 strings."""
+
+    mimetype = "application/json"
+
+    def dumps(self, obj, **kwargs):
+        return orjson.dumps(obj, default=_json_default, option=orjson.OPT_NON_STR_KEYS).decode()
+
+    def loads(self, s, **kwargs):
+        return orjson.loads(s)
+
+    def response(self, *args, **kwargs):
+        """Build the jsonify response from orjson's bytes without a str round-trip."""
+        obj = self._prepare_response_obj(args, kwargs)
+        body = orjson.dumps(obj, default=_json_default, option=orjson.OPT_NON_STR_KEYS | orjson.OPT_APPEND_NEWLINE)
+        return self._app.response_class(body, mimetype=self.mimetype)
+
+class UploadRequest(Request):
+    """Request that spools large uploads to a named temp file so the PDF parser can open them by path."""
+
+    def _get_file_stream(self, total_content_length, content_type, filename=None, content_length=None):
+        # Same 500KB threshold as Werkzeug's default, which uses an anonymous TemporaryFile
+        if total_content_length is None or total_content_length > 500 * 1024:
+            return NamedTemporaryFile("rb+")
+        return BytesIO()
+
 app = Flask(__name__)
+app.request_class = UploadRequest
+app.json = OrjsonProvider(app)
 app.config['SECRET_KEY'] = os.getenv('SECRET_KEY', 'your-secret-key-change-in-production')
-# Use simple session for Vercel compatibility
-app.config['SESSION_TYPE'] = 'filesystem'
-app.config['SESSION_FILE_DIR'] = '/tmp'  # Use /tmp for Vercel
+# Reject oversized uploads before they are read; accepted files are spooled to disk by Werkzeug
+app.config['MAX_CONTENT_LENGTH'] = int(os.getenv('MAX_UPLOAD_MB', 25)) * 1024 * 1024
+
+# Shared Redis client for sessions and caching; None when REDIS_URL is not configured
+_redis = redis.Redis.from_url(os.getenv('REDIS_URL')) if os.getenv('REDIS_URL') else None
+
+if _redis is not None:
+    app.config['SESSION_TYPE'] = 'redis'
+    app.config['SESSION_REDIS'] = _redis
+else:
+    # Use simple session for Vercel compatibility
+    app.config['SESSION_TYPE'] = 'filesystem'
+    app.config['SESSION_FILE_DIR'] = '/tmp'  # Use /tmp for Vercel
 Session(app)
 
+class JsonRedisSessionInterface(RedisSessionInterface):
+    """Redis session store that serializes with JSON instead of pickle and falls back to an empty session when Redis is down."""
+
+    serializer = orjson
+
+    def open_session(self, app, request):
+        try:
+            return super().open_session(app, request)
+        except redis.RedisError as e:
+            app.logger.warning("Session read failed: %s", e)
+            return self.session_class(sid=self._generate_sid(), permanent=self.permanent)
+
+    def save_session(self, app, session, response):
+        try:
+            super().save_session(app, session, response)
+        except redis.RedisError as e:
+            app.logger.warning("Session write failed: %s", e)
+
+if _redis is not None:
+    # Same settings Flask-Session resolved from SESSION_* config, with the safer serializer
+    redis_sessions = app.session_interface
+    app.session_interface = JsonRedisSessionInterface(
+        _redis, redis_sessions.key_prefix, redis_sessions.use_signer, redis_sessions.permanent)
+
 # Configure CORS to allow requests from your frontend domain
 CORS(app, 
      origins=["https://family-bill-share.vercel.app", "http://localhost:5173", "http://localhost:3000"],
@@ -87,140 +180,348 @@ def after_request(response):
     response.headers.add('Access-Control-Allow-Credentials', 'true')
     return response
 
-# Database connection function
+# Server-side prepared statements for the hottest lookups, PREPAREd once per connection.
+# Off by default: Supabase's transaction pooler (port 6543) and PgBouncer in transaction mode do not keep
+# PREPAREd statements across transactions. Opt in with PG_PREPARED_STATEMENTS=1 on a direct or session-mode connection
+USE_PREPARED_STATEMENTS = os.getenv('PG_PREPARED_STATEMENTS', '0') == '1'
+PREPARED_STATEMENTS = {
+    'get_user_by_email': ('text', """
+        SELECT id, name, email, password, created_at, updated_at
+        FROM group_bill_automation.bill_automator_users
+        WHERE email = %s
+    """),
+    'get_user_families': ('integer', """
+        SELECT id, family FROM group_bill_automation.bill_automator_families
+        WHERE user_id = %s ORDER BY id
+    """),
+    'get_user_emails': ('integer', """
+        SELECT id, emails FROM group_bill_automation.bill_automator_emails
+        WHERE user_id = %s
+    """),
+}
+
+class PooledConnection(psycopg2.extensions.connection):
+    """Connection that remembers which PREPARED_STATEMENTS have been prepared on it."""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.prepared_statements = set()
+
+def execute_prepared(cur, name, params):
+    """Run one of PREPARED_STATEMENTS, preparing it on this connection the first time."""
+    param_types, sql = PREPARED_STATEMENTS[name]
+    if not USE_PREPARED_STATEMENTS:
+        cur.execute(sql, params)
+        return
+
+    conn = cur.connection
+    if name not in conn.prepared_statements:
+        cur.execute(f"PREPARE {name}({param_types}) AS {sql.replace('%s', '$1')}")
+        conn.prepared_statements.add(name)
+    cur.execute(f"EXECUTE {name}(%s)", params)
+
+# Database connection pool, created on first use so the app can start without a database
+PG_POOL_MIN = int(os.getenv('PG_POOL_MIN', 2))
+PG_POOL_MAX = int(os.getenv('PG_POOL_MAX', 20))
+PG_POOL_TIMEOUT = float(os.getenv('PG_POOL_TIMEOUT', 10))
+_db_pool = None
+_db_pool_lock = threading.Lock()
+# ThreadedConnectionPool raises as soon as it is exhausted; this makes callers queue for a slot instead
+_db_pool_slots = threading.BoundedSemaphore(PG_POOL_MAX)
+
+def get_db_pool():
+    """Get the process-wide Supabase connection pool."""
+    global _db_pool
+    if _db_pool is None:
+        with _db_pool_lock:
+            if _db_pool is None:
+                _db_pool = ThreadedConnectionPool(
+                    minconn=PG_POOL_MIN,
+                    maxconn=PG_POOL_MAX,
+                    dsn=os.getenv('SQLALCHEMY_DATABASE_URI'),
+                    connection_factory=PooledConnection
+                )
+                atexit.register(_db_pool.closeall)
+    return _db_pool
+
 def get_db_connection():
-    """Get a connection to the Supabase database."""
+    """Check out a connection to the Supabase database from the pool, waiting up to PG_POOL_TIMEOUT for one."""
+    if not _db_pool_slots.acquire(timeout=PG_POOL_TIMEOUT):
+        raise PoolError("Timed out waiting for a database connection")
     try:
-        conn = psycopg2.connect(os.getenv('SQLALCHEMY_DATABASE_URI'))
-        return conn
-    except Exception as e:
-        print(f"Database connection error: {e}")
+        return get_db_pool().getconn()
+    except Exception:
+        _db_pool_slots.release()
+        raise
+
+def release_db_connection(conn):
+    """Return a connection to the pool, discarding it if it has been closed."""
+    try:
+        get_db_pool().putconn(conn, close=bool(conn.closed))
+    finally:
+        _db_pool_slots.release()
+
+@contextmanager
+def db_cursor(cursor_factory=None):
+    """Yield a cursor on a pooled connection, committing on success and rolling back on error."""
+    conn = get_db_connection()
+    try:
+        with conn.cursor(cursor_factory=cursor_factory) as cur:
+            yield cur
+        conn.commit()
+    except Exception:
+        if not conn.closed:
+            conn.rollback()
+        raise
+    finally:
+        release_db_connection(conn)
+
+# Helper functions for the Redis cache; every call is a no-op when Redis is unavailable.
+# Values are stored as JSON (datetimes as ISO strings, NUMERICs as strings), never pickled,
+# so a tampered cache entry can at worst yield bad data rather than run code
+PROFILE_CACHE_TTL = int(os.getenv('PROFILE_CACHE_TTL', 60))
+
+def cache_get(key):
+    """Return the cached value for key, or None on a miss."""
+    if _redis is None:
+        return None
+    try:
+        cached = _redis.get(key)
+    except redis.RedisError as e:
+        app.logger.warning("Cache read failed for %s: %s", key, e)
         return None
+    return orjson.loads(cached) if cached is not None else None
+
+def cache_set(key, value, ttl):
+    """Cache value under key for ttl seconds."""
+    if _redis is None:
+        return
+    try:
+        _redis.setex(key, ttl, orjson.dumps(value, default=_json_default, option=orjson.OPT_NON_STR_KEYS))
+    except redis.RedisError as e:
+        app.logger.warning("Cache write failed for %s: %s", key, e)
+
+def cache_delete(*keys):
+    """Drop keys from the cache."""
+    if _redis is None:
+        return
+    try:
+        _redis.delete(*keys)
+    except redis.RedisError as e:
+        app.logger.warning("Cache delete failed for %s: %s", keys, e)
+
+# Per-user cache entries: the profile plus the list endpoints the frontend refetches on navigation
+USER_CACHE_KINDS = ('profile', 'lines', 'family_mappings', 'reconciliation', 'line_transfer', 'automation_config')
+
+def invalidate_user_cache(user_id):
+    """Drop the user's cached profile and lists after their families, emails, lines or adjustments change."""
+    cache_delete(*(f"{kind}:{user_id}" for kind in USER_CACHE_KINDS))
+
+def cached_user_data(kind, user_id, load):
+    """Return the user's cached data of the given kind, calling load() and caching its result on a miss."""
+    cache_key = f"{kind}:{user_id}"
+    cached = cache_get(cache_key)
+    if cached is not None:
+        return cached
+    value = load()
+    cache_set(cache_key, value, PROFILE_CACHE_TTL)
+    return value
+
+# Parsed bills are cached by content hash so a retried upload of the same PDF is not parsed again
+PDF_CACHE_TTL = int(os.getenv('PDF_CACHE_TTL', 600))
+
+def extract_charges_cached(stream):
+    """Run extract_charges_from_pdf on an upload stream, reusing the result for a PDF seen in the last PDF_CACHE_TTL seconds."""
+    if _redis is None:
+        return extract_charges_from_pdf(stream)
+
+    digest = hashlib.sha256()
+    for chunk in iter(lambda: stream.read(1024 * 1024), b''):
+        digest.update(chunk)
+    stream.seek(0)
+
+    cache_key = f"pdf:{digest.hexdigest()}"
+    cached = cache_get(cache_key)
+    if cached is not None:
+        # JSON has no tuple keys, so line_details is cached as [[name, device, number], details] pairs
+        account_wide_value, line_items = cached
+        return account_wide_value, {tuple(key): details for key, details in line_items}
+
+    account_wide_value, line_details = extract_charges_from_pdf(stream)
+    cache_set(cache_key, [account_wide_value, list(line_details.items())], PDF_CACHE_TTL)
+    return account_wide_value, line_details
+
+# bcrypt cost factor for new hashes; raising it upgrades existing hashes on next sign-in
+BCRYPT_ROUNDS = int(os.getenv('BCRYPT_ROUNDS', 12))
+
+# Bounded executor for bcrypt so concurrent sign-ins can't oversubscribe the CPU
+BCRYPT_POOL = ThreadPoolExecutor(max_workers=os.cpu_count() or 1, thread_name_prefix='bcrypt')
+
+# Recently verified (password, hash) pairs, keyed by an HMAC under a per-process key
+# so the plaintext password is never held in memory
+PASSWORD_CACHE_SIZE = 1024
+_verified_passwords = OrderedDict()
+_verified_passwords_lock = threading.Lock()
+_password_cache_key = os.urandom(32)
 
 # Helper function to hash passwords
 def hash_password(password):
     """Hash a password using bcrypt."""
-    return bcrypt.hashpw(password.encode('utf-8'), bcrypt.gensalt()).decode('utf-8')
+    return BCRYPT_POOL.submit(bcrypt.hashpw, password.encode('utf-8'), bcrypt.gensalt(rounds=BCRYPT_ROUNDS)).result().decode('utf-8')
 
 # Helper function to check passwords
 def check_password(password, hashed):
     """Check if a password matches the hash."""
-    return bcrypt.checkpw(password.encode('utf-8'), hashed.encode('utf-8'))
+    digest = hmac.new(_password_cache_key, password.encode('utf-8'), hashlib.sha256).digest()
+    cache_key = (digest, hashed)
+    with _verified_passwords_lock:
+        if cache_key in _verified_passwords:
+            _verified_passwords.move_to_end(cache_key)
+            return True
+
+    if not BCRYPT_POOL.submit(bcrypt.checkpw, password.encode('utf-8'), hashed.encode('utf-8')).result():
+        return False
+
+    with _verified_passwords_lock:
+        _verified_passwords[cache_key] = True
+        if len(_verified_passwords) > PASSWORD_CACHE_SIZE:
+            _verified_passwords.popitem(last=False)
+    return True
+
+# Helper function to check whether a stored hash uses fewer rounds than configured
+def password_needs_rehash(hashed):
+    """Check if a bcrypt hash ($2b$NN$...) was created with fewer than BCRYPT_ROUNDS rounds."""
+    try:
+        return int(hashed.split('$')[2]) < BCRYPT_ROUNDS
+    except (IndexError, ValueError):
+        return False
 
 # Helper function to get user profile data
 def get_user_profile(user_id):
     """Get complete user profile including all related data."""
+    cache_key = f"profile:{user_id}"
+    cached = cache_get(cache_key)
+    if cached is not None:
+        return cached
+
     try:
-        conn = get_db_connection()
-        if not conn:
-            return None
-        
-        cur = conn.cursor()
-        
-        # Get user basic info
-        cur.execute("""
-            SELECT id, name, email, created_at, updated_at 
-            FROM group_bill_automation.bill_automator_users 
-            WHERE id = %s
-        """, (user_id,))
-        
-        user_data = cur.fetchone()
-        if not user_data:
-            cur.close()
-            conn.close()
-            return None
-        
-        user = {
-            "id": user_data[0],
-            "name": user_data[1],
-            "email": user_data[2],
-            "created_at": user_data[3].isoformat() if user_data[3] else None,
-            "updated_at": user_data[4].isoformat() if user_data[4] else None
-        }
-        
-        # Get user's families
-        cur.execute("""
-            SELECT id, family 
-            FROM group_bill_automation.bill_automator_families 
-            WHERE user_id = %s 
-            ORDER BY id
-        """, (user_id,))
-        
-        families = []
-        for family in cur.fetchall():
-            family_data = {
-                "id": family[0],
-                "family": family[1]
-            }
-            
-            # Get family mappings (line names) for each family
+        with db_cursor() as cur:
+            # Assemble the whole profile in a single round trip
             cur.execute("""
-                SELECT id, line_id 
-                FROM group_bill_automation.bill_automator_family_mapping 
-                WHERE family_id = %s 
-                ORDER BY id
-            """, (family[0],))
-            
-            family_data["line_mappings"] = [
-                {"id": mapping[0], "line_id": mapping[1]} 
-                for mapping in cur.fetchall()
-            ]
-            
-            families.append(family_data)
-        
-        # Get user's emails
-        cur.execute("""
-            SELECT id, emails 
-            FROM group_bill_automation.bill_automator_emails 
-            WHERE user_id = %s
-        """, (user_id,))
-        
-        email_data = cur.fetchone()
-        emails = email_data[1] if email_data else []
-        
-        # Get user's line adjustments
-        cur.execute("""
-            SELECT id, transfer_amount, line_to_remove_from, line_to_add_to 
-            FROM group_bill_automation.bill_automator_line_discount_transfer_adjustment 
-            WHERE user_id = %s 
-            ORDER BY id
-        """, (user_id,))
-        
-        line_adjustments = [
-            {
-                "id": adj[0],
-                "transfer_amount": float(adj[1]) if adj[1] else 0,
-                "line_to_remove_from": adj[2],
-                "line_to_add_to": adj[3]
-            }
-            for adj in cur.fetchall()
-        ]
-        
-        # Get user's account reconciliation settings
-        cur.execute("""
-            SELECT id, reconciliation 
-            FROM group_bill_automation.bill_automator_accountwide_reconciliation 
-            WHERE user_id = %s
-        """, (user_id,))
-        
-        reconciliation_data = cur.fetchone()
-        reconciliation = reconciliation_data[1] if reconciliation_data else None
-        
-        cur.close()
-        conn.close()
-        
-        return {
-            "user": user,
-            "families": families,
-            "emails": emails,
-            "line_adjustments": line_adjustments,
-            "reconciliation": reconciliation,
-            "is_configured": len(families) > 0 and len(emails) > 0
-        }
-        
-    except Exception as e:
-        print(f"Error getting user profile: {e}")
+                SELECT jsonb_build_object(
+                    'user', (
+                        SELECT jsonb_build_object(
+                            'id', u.id,
+                            'name', u.name,
+                            'email', u.email,
+                            'created_at', u.created_at,
+                            'updated_at', u.updated_at
+                        )
+                        FROM group_bill_automation.bill_automator_users u
+                        WHERE u.id = %(user_id)s
+                    ),
+                    'families', (
+                        SELECT coalesce(jsonb_agg(jsonb_build_object(
+                            'id', f.id,
+                            'family', f.family,
+                            'line_mappings', (
+                                SELECT coalesce(jsonb_agg(jsonb_build_object('id', m.id, 'line_id', m.line_id) ORDER BY m.id), '[]'::jsonb)
+                                FROM group_bill_automation.bill_automator_family_mapping m
+                                WHERE m.family_id = f.id
+                            )
+                        ) ORDER BY f.id), '[]'::jsonb)
+                        FROM group_bill_automation.bill_automator_families f
+                        WHERE f.user_id = %(user_id)s
+                    ),
+                    'emails', coalesce((
+                        SELECT to_jsonb(e.emails)
+                        FROM group_bill_automation.bill_automator_emails e
+                        WHERE e.user_id = %(user_id)s
+                        LIMIT 1
+                    ), '[]'::jsonb),
+                    'line_adjustments', (
+                        SELECT coalesce(jsonb_agg(jsonb_build_object(
+                            'id', a.id,
+                            'transfer_amount', coalesce(a.transfer_amount, 0),
+                            'line_to_remove_from', a.line_to_remove_from,
+                            'line_to_add_to', a.line_to_add_to
+                        ) ORDER BY a.id), '[]'::jsonb)
+                        FROM group_bill_automation.bill_automator_line_discount_transfer_adjustment a
+                        WHERE a.user_id = %(user_id)s
+                    ),
+                    'reconciliation', (
+                        SELECT r.reconciliation
+                        FROM group_bill_automation.bill_automator_accountwide_reconciliation r
+                        WHERE r.user_id = %(user_id)s
+                        LIMIT 1
+                    )
+                )
+            """, {"user_id": user_id})
+
+            profile = cur.fetchone()[0]
+
+        if not profile["user"]:
+            return None
+
+        profile["is_configured"] = len(profile["families"]) > 0 and len(profile["emails"]) > 0
+        cache_set(cache_key, profile, PROFILE_CACHE_TTL)
+        return profile
+
+    except Exception:
+        # Let database errors reach the caller as a 500; None means only that the user does not exist
+        app.logger.exception("Error getting user profile")
+        raise
+
+# Only PDF uploads need more than this; every JSON endpoint fits comfortably in 1 MB
+MAX_JSON_BODY_BYTES = 1 << 20
+
+# Turn away oversized uploads from their Content-Length before any of the body is read
+@app.before_request
+def reject_oversized_requests():
+    """Reject requests larger than MAX_CONTENT_LENGTH, or MAX_JSON_BODY_BYTES for non-upload bodies."""
+    if request.content_length is None:
         return None
+    if request.mimetype != 'multipart/form-data' and request.content_length > MAX_JSON_BODY_BYTES:
+        return jsonify({"error": "Request body too large"}), 413
+    if request.content_length > app.config['MAX_CONTENT_LENGTH']:
+        return jsonify({"error": f"File too large (max {app.config['MAX_CONTENT_LENGTH'] // (1024 * 1024)} MB)"}), 413
+
+# Rate limit sign-in/sign-up per client IP and email, so one client can't monopolize the bcrypt pool
+def auth_rate_limit_key():
+    """Key auth rate limits by remote address plus a hash of the submitted email."""
+    data = request.get_json(silent=True)
+    email = data.get('email') if isinstance(data, dict) else None
+    email_hash = hashlib.sha256(str(email).strip().lower().encode('utf-8')).hexdigest()[:16] if email else ''
+    return f"{get_remote_address()}:{email_hash}"
+
+AUTH_RATE_LIMIT = os.getenv('AUTH_RATE_LIMIT', '5 per minute')
+# A Redis outage must not lock users out: count in process memory until it is back, and never fail the request
+limiter = Limiter(auth_rate_limit_key, app=app, storage_uri=os.getenv('REDIS_URL') or 'memory://',
+                  swallow_errors=True, in_memory_fallback_enabled=True)
+
+@app.errorhandler(429)
+def rate_limited(e):
+    """Handle requests over an endpoint's rate limit."""
+    return jsonify({"error": "Too many attempts, please try again later"}), 429
+
+# Helper function to validate a password before it is handed to bcrypt
+def password_error(password):
+    """Return an error message if password is not a string of 1-72 bytes (bcrypt ignores anything longer)."""
+    if not isinstance(password, str) or not password:
+        return "Password must be a non-empty string"
+    if len(password.encode('utf-8')) > 72:
+        return "Password must be at most 72 bytes"
+    return None
+
+# Helper function for GET responses the browser may revalidate with If-None-Match
+def conditional_json(payload):
+    """Return payload as JSON with an ETag, or an empty 304 if the client's copy is current."""
+    response = jsonify(payload)
+    response.set_etag(hashlib.blake2b(response.get_data(), digest_size=16).hexdigest())
+    # no-cache rather than max-age so a list refetched right after an edit is never stale
+    response.headers['Cache-Control'] = 'private, no-cache'
+    response.vary.add('Authorization')
+    return response.make_conditional(request)
 
 # Add a preflight handler for OPTIONS requests
 @app.route('/api/<path:path>', methods=['OPTIONS'])
@@ -250,46 +551,39 @@ def test_endpoint():
     })
 
 @app.route('/api/auth/signup', methods=['POST'])
+@limiter.limit(AUTH_RATE_LIMIT)
 def signup():
     """Create a new user account."""
     try:
         data = request.get_json()
         if not data or 'name' not in data or 'email' not in data or 'password' not in data:
             return jsonify({"error": "Missing required fields: name, email, password"}), 400
-        
-        # Check if user already exists
-        conn = get_db_connection()
-        if not conn:
-            return jsonify({"error": "Database connection failed"}), 500
-        
-        cur = conn.cursor()
-        
-        # Check if email already exists
-        cur.execute("SELECT id FROM group_bill_automation.bill_automator_users WHERE email = %s", (data['email'],))
-        if cur.fetchone():
-            cur.close()
-            conn.close()
-            return jsonify({"error": "User with this email already exists"}), 409
-        
-        # Hash the password
-        hashed_password = hash_password(data['password'])
-        
-        # Create the user
-        cur.execute("""
-            INSERT INTO group_bill_automation.bill_automator_users (name, email, password, created_at, updated_at)
-            VALUES (%s, %s, %s, NOW(), NOW())
-            RETURNING id, name, email, created_at
-        """, (data['name'], data['email'], hashed_password))
-        
-        user_data = cur.fetchone()
-        conn.commit()
-        
-        cur.close()
-        conn.close()
-        
+
+        error = password_error(data['password'])
+        if error:
+            return jsonify({"error": error}), 400
+
+        with db_cursor() as cur:
+            # Check if email already exists
+            execute_prepared(cur, 'get_user_by_email', (data['email'],))
+            if cur.fetchone():
+                return jsonify({"error": "User with this email already exists"}), 409
+
+            # Hash the password
+            hashed_password = hash_password(data['password'])
+
+            # Create the user
+            cur.execute("""
+                INSERT INTO group_bill_automation.bill_automator_users (name, email, password, created_at, updated_at)
+                VALUES (%s, %s, %s, NOW(), NOW())
+                RETURNING id, name, email, created_at
+            """, (data['name'], data['email'], hashed_password))
+
+            user_data = cur.fetchone()
+
         # Create JWT token
         token = create_jwt_token(user_data[0], user_data[2])
-        
+
         return jsonify({
             "message": "User created successfully",
             "token": token,
@@ -297,48 +591,57 @@ def signup():
                 "id": user_data[0],
                 "name": user_data[1],
                 "email": user_data[2],
-                "created_at": user_data[3].isoformat() if user_data[3] else None
+                "created_at": user_data[3]
             }
         }), 201
-    
+
     except Exception as e:
         return jsonify({"error": str(e)}), 500
 
 @app.route('/api/auth/signin', methods=['POST'])
+@limiter.limit(AUTH_RATE_LIMIT)
 def signin():
     """Authenticate an existing user."""
     try:
         data = request.get_json()
         if not data or 'email' not in data or 'password' not in data:
             return jsonify({"error": "Missing required fields: email, password"}), 400
-        
-        conn = get_db_connection()
-        if not conn:
-            return jsonify({"error": "Database connection failed"}), 500
-        
-        cur = conn.cursor()
-        
-        # Get user by email
-        cur.execute("""
-            SELECT id, name, email, password, created_at, updated_at 
-            FROM group_bill_automation.bill_automator_users 
-            WHERE email = %s
-        """, (data['email'],))
-        
-        user_data = cur.fetchone()
-        cur.close()
-        conn.close()
-        
+
+        # Only the type is checked here so accounts created before the 72-byte limit can still sign in
+        if not isinstance(data['password'], str) or not data['password']:
+            return jsonify({"error": "Invalid email or password"}), 401
+
+        with db_cursor() as cur:
+            # Get user by email
+            execute_prepared(cur, 'get_user_by_email', (data['email'],))
+
+            user_data = cur.fetchone()
+
         if not user_data:
             return jsonify({"error": "Invalid email or password"}), 401
-        
+
         # Check password
         if not check_password(data['password'], user_data[3]):
             return jsonify({"error": "Invalid email or password"}), 401
-        
+
+        # Upgrade the stored hash if BCRYPT_ROUNDS has been raised since it was created
+        if password_needs_rehash(user_data[3]):
+            try:
+                with db_cursor() as cur:
+                    cur.execute("""
+                        UPDATE group_bill_automation.bill_automator_users
+                        SET password = %s
+                        WHERE id = %s
+                    """, (hash_password(data['password']), user_data[0]))
+            except Exception:
+                app.logger.exception("Error rehashing password for user %s", user_data[0])
+
+        # Start each login from fresh profile data
+        invalidate_user_cache(user_data[0])
+
         # Create JWT token
         token = create_jwt_token(user_data[0], user_data[2])
-        
+
         return jsonify({
             "message": "Sign in successful",
             "token": token,
@@ -346,11 +649,11 @@ def signin():
                 "id": user_data[0],
                 "name": user_data[1],
                 "email": user_data[2],
-                "created_at": user_data[4].isoformat() if user_data[4] else None,
-                "updated_at": user_data[5].isoformat() if user_data[5] else None
+                "created_at": user_data[4],
+                "updated_at": user_data[5]
             }
         })
-    
+
     except Exception as e:
         return jsonify({"error": str(e)}), 500
 
@@ -358,18 +661,23 @@ def signin():
 @require_auth
 def get_profile():
     """Get the current user's complete profile."""
-    profile = get_user_profile(request.user_id)
-    if not profile:
-        return jsonify({"error": "User not found"}), 404
-    
-    return jsonify(profile)
+    try:
+        profile = get_user_profile(request.user_id)
+        if not profile:
+            return jsonify({"error": "User not found"}), 404
+
+        return jsonify(profile)
+
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
 
 @app.route('/api/auth/signout', methods=['POST'])
 @require_auth
 def signout():
     """Sign out the current user."""
-    # With JWT, we don't need to clear anything server-side
+    # With JWT, we don't need to clear anything server-side beyond the cached profile
     # The client should discard the token
+    invalidate_user_cache(request.user_id)
     return jsonify({"message": "Signed out successfully"})
 
 @app.route('/api/auth/check', methods=['GET'])
@@ -377,85 +685,58 @@ def signout():
 def check_auth():
     """Check if user is authenticated and return basic user info."""
     try:
-        conn = get_db_connection()
-        if not conn:
-            return jsonify({"error": "Database connection failed"}), 500
-        
-        cur = conn.cursor()
-        cur.execute("""
-            SELECT id, name, email 
-            FROM group_bill_automation.bill_automator_users 
-            WHERE id = %s
-        """, (request.user_id,))
-        
-        user_data = cur.fetchone()
-        
-        if not user_data:
-            cur.close()
-            conn.close()
-            return jsonify({"authenticated": False}), 401
-        
-        # Get full user profile data
+        # The profile query also confirms the user still exists
         profile = get_user_profile(request.user_id)
-        
-        cur.close()
-        conn.close()
-        
-        if profile:
-            return jsonify({
-                "authenticated": True,
-                "user": {
-                    "id": user_data[0],
-                    "name": user_data[1],
-                    "email": user_data[2]
-                },
-                "is_configured": profile["is_configured"],
-                "profile": profile
-            })
-        else:
-            # Fallback to basic data if profile loading fails
-            return jsonify({
-                "authenticated": True,
-                "user": {
-                    "id": user_data[0],
-                    "name": user_data[1],
-                    "email": user_data[2]
-                },
-                "is_configured": False
-            })
-        
+
+        if not profile:
+            return jsonify({"authenticated": False}), 401
+
+        return jsonify({
+            "authenticated": True,
+            "user": {
+                "id": profile["user"]["id"],
+                "name": profile["user"]["name"],
+                "email": profile["user"]["email"]
+            },
+            "is_configured": profile["is_configured"],
+            "profile": profile
+        })
+
     except Exception as e:
         return jsonify({"error": str(e)}), 500
 
 
 
+# Page size for /api/users, overridable per request with ?limit= up to the maximum
+USERS_PAGE_SIZE = 100
+USERS_MAX_PAGE_SIZE = 500
+
 @app.route('/api/users', methods=['GET'])
 def get_users():
-    """Get all users from the database."""
+    """Get a page of users from the database, ordered by id."""
     try:
-        conn = get_db_connection()
-        if not conn:
-            return jsonify({"error": "Database connection failed"}), 500
-        
-        cur = conn.cursor()
-        cur.execute("SELECT id, name, email, created_at, updated_at FROM group_bill_automation.bill_automator_users ORDER BY id")
-        users = cur.fetchall()
-        
-        user_list = []
-        for user in users:
-            user_list.append({
-                "id": user[0],
-                "name": user[1],
-                "email": user[2],
-                "created_at": user[3].isoformat() if user[3] else None,
-                "updated_at": user[4].isoformat() if user[4] else None
-            })
-        
-        cur.close()
-        conn.close()
-        
-        return jsonify({"users": user_list})
-    
+        try:
+            limit = min(max(int(request.args.get('limit', USERS_PAGE_SIZE)), 1), USERS_MAX_PAGE_SIZE)
+            after_id = int(request.args.get('after', 0))
+        except ValueError:
+            return jsonify({"error": "limit and after must be integers"}), 400
+
+        with db_cursor(RealDictCursor) as cur:
+            # Keyset pagination: walk the primary key index from the last id the client saw
+            cur.execute("""
+                SELECT id, name, email, created_at, updated_at
+                FROM group_bill_automation.bill_automator_users
+                WHERE id > %s
+                ORDER BY id
+                LIMIT %s
+            """, (after_id, limit))
+            users = cur.fetchall()
+
+        return conditional_json({
+            "users": users,
+            "next_after": users[-1]["id"] if len(users) == limit else None
+        })
+
     except Exception as e:
         return jsonify({"error": str(e)}), 500
 
@@ -466,26 +747,18 @@ def create_user():
         data = request.get_json()
         if not data or 'name' not in data or 'email' not in data or 'password' not in data:
             return jsonify({"error": "Missing required fields: name, email, password"}), 500
-        
-        conn = get_db_connection()
-        if not conn:
-            return jsonify({"error": "Database connection failed"}), 500
-        
-        cur = conn.cursor()
-        cur.execute("""
-            INSERT INTO group_bill_automation.bill_automator_users (name, email, password, created_at, updated_at)
-            VALUES (%s, %s, %s, NOW(), NOW())
-            RETURNING id
-        """, (data['name'], data['email'], data['password']))
-        
-        user_id = cur.fetchone()[0]
-        conn.commit()
-        
-        cur.close()
-        conn.close()
-        
+
+        with db_cursor() as cur:
+            cur.execute("""
+                INSERT INTO group_bill_automation.bill_automator_users (name, email, password, created_at, updated_at)
+                VALUES (%s, %s, %s, NOW(), NOW())
+                RETURNING id
+            """, (data['name'], data['email'], data['password']))
+
+            user_id = cur.fetchone()[0]
+
         return jsonify({"message": "User created successfully", "user_id": user_id}), 201
-    
+
     except Exception as e:
         return jsonify({"error": str(e)}), 500
 
@@ -494,189 +767,77 @@ def create_user():
 def get_families():
     """Get all families for the authenticated user."""
     try:
-        conn = get_db_connection()
-        if not conn:
-            return jsonify({"error": "Database connection failed"}), 500
-        
-        cur = conn.cursor()
-        cur.execute("""
-            SELECT id, family FROM group_bill_automation.bill_automator_families 
-            WHERE user_id = %s ORDER BY id
-        """, (request.user_id,))
-        families = cur.fetchall()
-        
-        family_list = []
-        for family in families:
-            family_list.append({
-                "id": family[0],
-                "family": family[1]
-            })
-        
-        cur.close()
-        conn.close()
-        
-        return jsonify({"families": family_list})
-    
+        with db_cursor(RealDictCursor) as cur:
+            execute_prepared(cur, 'get_user_families', (request.user_id,))
+            families = cur.fetchall()
+
+        return conditional_json({"families": families})
+
     except Exception as e:
         return jsonify({"error": str(e)}), 500
 
-@app.route('/api/families', methods=['POST'])
-@require_auth
-def create_families():
-    """Create or update families for the authenticated user while preserving mappings."""
-
+# Helper function shared by the families POST and PUT routes
+def _upsert_families(user_id, data, message):
+    """Replace a user's families with data['families'], keeping IDs (and mappings) of names that remain."""
     try:
-        data = request.get_json()
         if not data or 'families' not in data or not isinstance(data['families'], list):
-            return jsonify({"error": "Missing required field: families (must be an array)"}), 400
+            return 400, {"error": "Missing required field: families (must be an array)"}
 
-        conn = get_db_connection()
-        if not conn:
-            return jsonify({"error": "Database connection failed"}), 500
+        # Keep the first occurrence of each name, in the order given
+        family_names = list(dict.fromkeys(data['families']))
 
-        cur = conn.cursor()
+        with db_cursor() as cur:
+            execute_prepared(cur, 'get_user_families', (user_id,))
+            family_ids = {row[1]: row[0] for row in cur.fetchall()}  # family_name -> family_id
+            app.logger.debug("%s /api/families existing=%s new=%s", request.method, family_ids, family_names)
 
-        # Get existing families to preserve mappings
-        cur.execute("""
-            SELECT id, family
-            FROM group_bill_automation.bill_automator_families
-            WHERE user_id = %s
-        """, (request.user_id,))
-
-        existing_families = {}
-        for row in cur.fetchall():
-            existing_families[row[1]] = row[0]  # family_name -> family_id
-
-        print(f"POST /api/families - Existing families: {existing_families}")
-        print(f"POST /api/families - New families: {data['families']}")
-
-        families_data = []
-
-        # Process each family
-        for family_name in data['families']:
-            if family_name in existing_families:
-                # Family already exists, keep the existing ID
-                family_id = existing_families[family_name]
-                print(f"Preserving existing family: {family_name} (ID: {family_id})")
-                families_data.append({
-                    "id": family_id,
-                    "family": family_name
-                })
-            else:
-                # New family, insert it
-                print(f"Creating new family: {family_name}")
-                cur.execute("""
+            # Existing families keep their IDs and therefore their mappings
+            to_add = [family_name for family_name in family_names if family_name not in family_ids]
+            to_delete = [family_ids[family_name] for family_name in family_ids.keys() - set(family_names)]
+
+            if to_add:
+                # DO UPDATE (rather than NOTHING) so a row added concurrently is still returned
+                rows = execute_values(cur, """
                     INSERT INTO group_bill_automation.bill_automator_families (user_id, family)
-                    VALUES (%s, %s)
+                    VALUES %s
+                    ON CONFLICT (user_id, family) DO UPDATE SET family = EXCLUDED.family
                     RETURNING id, family
-                """, (request.user_id, family_name))
-
-                family_data = cur.fetchone()
-                families_data.append({
-                    "id": family_data[0],
-                    "family": family_data[1]
-                })
+                """, [(user_id, family_name) for family_name in to_add], fetch=True)
+                family_ids.update({row[1]: row[0] for row in rows})
 
-        # Remove families that are no longer in the list
-        new_family_names = set(data['families'])
-        for existing_family_name, existing_family_id in existing_families.items():
-            if existing_family_name not in new_family_names:
-                # Delete the family (this will cascade delete mappings due to foreign key)
+            if to_delete:
+                # Delete removed families (this will cascade delete mappings due to foreign key)
                 cur.execute("""
                     DELETE FROM group_bill_automation.bill_automator_families
-                    WHERE id = %s
-                """, (existing_family_id,))
+                    WHERE id = ANY(%s)
+                """, (to_delete,))
 
-        conn.commit()
-        cur.close()
-        conn.close()
+        invalidate_user_cache(user_id)
 
-        return jsonify({
-            "message": "Families saved successfully",
-            "families": families_data
-        }), 200
+        return 200, {
+            "message": message,
+            "families": [
+                {"id": family_ids[family_name], "family": family_name}
+                for family_name in family_names
+            ]
+        }
 
     except Exception as e:
-        return jsonify({"error": str(e)}), 500
+        return 500, {"error": str(e)}
+
+@app.route('/api/families', methods=['POST'])
+@require_auth
+def create_families():
+    """Create or update families for the authenticated user while preserving mappings."""
+    status, body = _upsert_families(request.user_id, request.get_json(silent=True), "Families saved successfully")
+    return jsonify(body), status
 
 @app.route('/api/families', methods=['PUT'])
 @require_auth
 def update_families():
     """Update families for the authenticated user while preserving mappings."""
-
-    try:
-        data = request.get_json()
-        if not data or 'families' not in data or not isinstance(data['families'], list):
-            return jsonify({"error": "Missing required field: families (must be an array)"}), 400
-
-        conn = get_db_connection()
-        if not conn:
-            return jsonify({"error": "Database connection failed"}), 500
-
-        cur = conn.cursor()
-
-        # Get existing families to preserve mappings
-        cur.execute("""
-            SELECT id, family
-            FROM group_bill_automation.bill_automator_families
-            WHERE user_id = %s
-        """, (request.user_id,))
-
-        existing_families = {}
-        for row in cur.fetchall():
-            existing_families[row[1]] = row[0]  # family_name -> family_id
-
-        print(f"PUT /api/families - Existing families: {existing_families}")
-        print(f"PUT /api/families - New families: {data['families']}")
-
-        families_data = []
-
-        # Process each family
-        for family_name in data['families']:
-            if family_name in existing_families:
-                # Family already exists, keep the existing ID
-                family_id = existing_families[family_name]
-                print(f"PUT - Preserving existing family: {family_name} (ID: {family_id})")
-                families_data.append({
-                    "id": family_id,
-                    "family": family_name
-                })
-            else:
-                # New family, insert it
-                print(f"PUT - Creating new family: {family_name}")
-                cur.execute("""
-                    INSERT INTO group_bill_automation.bill_automator_families (user_id, family)
-                    VALUES (%s, %s)
-                    RETURNING id, family
-                """, (request.user_id, family_name))
-
-                family_data = cur.fetchone()
-                families_data.append({
-                    "id": family_data[0],
-                    "family": family_data[1]
-                })
-
-        # Remove families that are no longer in the list
-        new_family_names = set(data['families'])
-        for existing_family_name, existing_family_id in existing_families.items():
-            if existing_family_name not in new_family_names:
-                # Delete the family (this will cascade delete mappings due to foreign key)
-                cur.execute("""
-                    DELETE FROM group_bill_automation.bill_automator_families
-                    WHERE id = %s
-                """, (existing_family_id,))
-
-        conn.commit()
-        cur.close()
-        conn.close()
-
-        return jsonify({
-            "message": "Families updated successfully",
-            "families": families_data
-        }), 200
-
-    except Exception as e:
-        return jsonify({"error": str(e)}), 500
+    status, body = _upsert_families(request.user_id, request.get_json(silent=True), "Families updated successfully")
+    return jsonify(body), status
 
 @app.route('/api/emails', methods=['GET'])
 @require_auth
@@ -686,135 +847,60 @@ def get_emails():
         user_id = request.args.get('user_id')
         if not user_id:
             return jsonify({"error": "user_id parameter required"}), 400
-        
-        conn = get_db_connection()
-        if not conn:
-            return jsonify({"error": "Database connection failed"}), 500
-        
-        cur = conn.cursor()
-        cur.execute("""
-            SELECT id, emails FROM group_bill_automation.bill_automator_emails 
-            WHERE user_id = %s
-        """, (user_id,))
-        
-        email_data = cur.fetchone()
-        emails = email_data[1] if email_data else []
-        
-        cur.close()
-        conn.close()
-        
-        return jsonify({"emails": emails})
-    
+
+        with db_cursor(RealDictCursor) as cur:
+            execute_prepared(cur, 'get_user_emails', (user_id,))
+
+            email_data = cur.fetchone()
+
+        emails = email_data["emails"] if email_data else []
+
+        return conditional_json({"emails": emails})
+
     except Exception as e:
         return jsonify({"error": str(e)}), 500
 
-@app.route('/api/emails', methods=['POST'])
-@require_auth
-def create_emails():
-    """Create or update emails for the authenticated user."""
-    
+# Helper function shared by the emails POST and PUT routes
+def _upsert_emails(user_id, data, message):
+    """Create or replace a user's email list with data['emails']."""
     try:
-        data = request.get_json()
         if not data or 'emails' not in data or not isinstance(data['emails'], list):
-            return jsonify({"error": "Missing required field: emails (must be an array)"}), 400
-        
-        conn = get_db_connection()
-        if not conn:
-            return jsonify({"error": "Database connection failed"}), 500
-        
-        cur = conn.cursor()
-        
-        # Check if user already has an emails record
-        cur.execute("""
-            SELECT id FROM group_bill_automation.bill_automator_emails 
-            WHERE user_id = %s
-        """, (request.user_id,))
-        
-        existing_record = cur.fetchone()
-        
-        if existing_record:
-            # Update existing record
-            cur.execute("""
-                UPDATE group_bill_automation.bill_automator_emails 
-                SET emails = %s 
-                WHERE user_id = %s
-                RETURNING id, emails
-            """, (data['emails'], request.user_id))
-        else:
-            # Create new record
+            return 400, {"error": "Missing required field: emails (must be an array)"}
+
+        with db_cursor() as cur:
+            # Create the user's emails record or replace its list
             cur.execute("""
                 INSERT INTO group_bill_automation.bill_automator_emails (user_id, emails)
                 VALUES (%s, %s)
+                ON CONFLICT (user_id) DO UPDATE SET emails = EXCLUDED.emails
                 RETURNING id, emails
-            """, (request.user_id, data['emails']))
-        
-        email_data = cur.fetchone()
-        conn.commit()
-        
-        cur.close()
-        conn.close()
-        
-        return jsonify({
-            "message": "Emails saved successfully",
+            """, (user_id, data['emails']))
+
+            email_data = cur.fetchone()
+
+        invalidate_user_cache(user_id)
+
+        return 200, {
+            "message": message,
             "emails": email_data[1]
-        }), 200
-    
+        }
+
     except Exception as e:
-        return jsonify({"error": str(e)}), 500
+        return 500, {"error": str(e)}
+
+@app.route('/api/emails', methods=['POST'])
+@require_auth
+def create_emails():
+    """Create or update emails for the authenticated user."""
+    status, body = _upsert_emails(request.user_id, request.get_json(silent=True), "Emails saved successfully")
+    return jsonify(body), status
 
 @app.route('/api/emails', methods=['PUT'])
 @require_auth
 def update_emails():
     """Update emails for the authenticated user."""
-    
-    try:
-        data = request.get_json()
-        if not data or 'emails' not in data or not isinstance(data['emails'], list):
-            return jsonify({"error": "Missing required field: emails (must be an array)"}), 400
-        
-        conn = get_db_connection()
-        if not conn:
-            return jsonify({"error": "Database connection failed"}), 500
-        
-        cur = conn.cursor()
-        
-        # Check if user already has an emails record
-        cur.execute("""
-            SELECT id FROM group_bill_automation.bill_automator_emails 
-            WHERE user_id = %s
-        """, (request.user_id,))
-        
-        existing_record = cur.fetchone()
-        
-        if existing_record:
-            # Update existing record
-            cur.execute("""
-                UPDATE group_bill_automation.bill_automator_emails 
-                SET emails = %s 
-                WHERE user_id = %s
-                RETURNING id, emails
-            """, (data['emails'], request.user_id))
-        else:
-            # Create new record
-            cur.execute("""
-                INSERT INTO group_bill_automation.bill_automator_emails (user_id, emails)
-                VALUES (%s, %s)
-                RETURNING id, emails
-            """, (request.user_id, data['emails']))
-        
-        email_data = cur.fetchone()
-        conn.commit()
-        
-        cur.close()
-        conn.close()
-        
-        return jsonify({
-            "message": "Emails updated successfully",
-            "emails": email_data[1]
-        }), 200
-    
-    except Exception as e:
-        return jsonify({"error": str(e)}), 500
+    status, body = _upsert_emails(request.user_id, request.get_json(silent=True), "Emails updated successfully")
+    return jsonify(body), status
 
 @app.route('/api/onboarding/complete', methods=['POST'])
 @require_auth
@@ -839,47 +925,34 @@ def complete_onboarding():
 @require_auth
 def process_bill():
     """Process bill with conditional logic based on user configuration."""
-    
+
     try:
         # Get the PDF file from the request
         if 'pdf' not in request.files:
             return jsonify({"error": "No PDF file provided"}), 400
-        
+
         pdf_file = request.files['pdf']
         if pdf_file.filename == '':
             return jsonify({"error": "No PDF file selected"}), 400
-        
-        # Get user configuration to determine process type
-        conn = get_db_connection()
-        if not conn:
-            return jsonify({"error": "Database connection failed"}), 500
-        
-        cur = conn.cursor()
-        
-        # Check if user has complete configuration
-        cur.execute("""
-            SELECT 
-                (SELECT COUNT(*) FROM group_bill_automation.bill_automator_families WHERE user_id = %s) as family_count,
-                (SELECT COUNT(*) FROM group_bill_automation.bill_automator_emails WHERE user_id = %s) as email_count,
-                (SELECT COUNT(*) FROM group_bill_automation.bill_automator_line_discount_transfer_adjustment WHERE user_id = %s) as adjustment_count
-        """, (request.user_id, request.user_id, request.user_id))
-        
-        config_data = cur.fetchone()
-        cur.close()
-        conn.close()
-        
-        family_count = config_data[0] or 0
-        email_count = config_data[1] or 0
-        adjustment_count = config_data[2] or 0
-        
+
+        # Get user configuration (usually from the profile cache) to determine process type;
+        # a database error raises into the 500 handler below, so the 404 means the user is really gone
+        profile = get_user_profile(request.user_id)
+        if not profile:
+            return jsonify({"error": "User not found"}), 404
+
+        family_count = len(profile["families"])
+        email_count = len(profile["emails"])
+        adjustment_count = len(profile["line_adjustments"])
+
         # Determine if user has complete configuration
         has_complete_config = family_count > 0 and email_count > 0 and adjustment_count > 0
-        
+
         if has_complete_config:
             # Quick process - use existing configuration
             pdf_service = PDFService(request.user_id)
             result = pdf_service.parse_verizon_bill(pdf_file)
-            
+
             if result['success']:
                 # Send emails using saved configuration
                 # This would integrate with the existing email sending logic
@@ -901,7 +974,7 @@ def process_bill():
                     "adjustments": adjustment_count
                 }
             })
-    
+
     except Exception as e:
         return jsonify({"error": str(e)}), 500
 
@@ -911,46 +984,37 @@ def process_bill():
 @require_auth
 def add_family():
     """Add a single family for the authenticated user."""
-    
+
     try:
         data = request.get_json()
         if not data or 'family' not in data or not isinstance(data['family'], str):
             return jsonify({"error": "Missing required field: family (must be a string)"}), 400
-        
+
         family_name = data['family'].strip()
         if not family_name:
             return jsonify({"error": "Family name cannot be empty"}), 400
-        
-        conn = get_db_connection()
-        if not conn:
-            return jsonify({"error": "Database connection failed"}), 500
-        
-        cur = conn.cursor()
-        
-        # Check if family already exists for this user
-        cur.execute("""
-            SELECT id FROM group_bill_automation.bill_automator_families 
-            WHERE user_id = %s AND family = %s
-        """, (request.user_id, family_name))
-        
-        if cur.fetchone():
-            cur.close()
-            conn.close()
-            return jsonify({"error": "Family with this name already exists"}), 409
-        
-        # Insert new family
-        cur.execute("""
-            INSERT INTO group_bill_automation.bill_automator_families (user_id, family)
-            VALUES (%s, %s)
-            RETURNING id, family
-        """, (request.user_id, family_name))
-        
-        family_data = cur.fetchone()
-        conn.commit()
-        
-        cur.close()
-        conn.close()
-        
+
+        with db_cursor() as cur:
+            # Check if family already exists for this user
+            cur.execute("""
+                SELECT id FROM group_bill_automation.bill_automator_families
+                WHERE user_id = %s AND family = %s
+            """, (request.user_id, family_name))
+
+            if cur.fetchone():
+                return jsonify({"error": "Family with this name already exists"}), 409
+
+            # Insert new family
+            cur.execute("""
+                INSERT INTO group_bill_automation.bill_automator_families (user_id, family)
+                VALUES (%s, %s)
+                RETURNING id, family
+            """, (request.user_id, family_name))
+
+            family_data = cur.fetchone()
+
+        invalidate_user_cache(request.user_id)
+
         return jsonify({
             "message": "Family added successfully",
             "family": {
@@ -958,7 +1022,7 @@ def add_family():
                 "family": family_data[1]
             }
         }), 200
-    
+
     except Exception as e:
         return jsonify({"error": str(e)}), 500
 
@@ -966,71 +1030,43 @@ def add_family():
 @require_auth
 def add_email():
     """Add a single email for the authenticated user."""
-    
+
     try:
         data = request.get_json()
         if not data or 'email' not in data or not isinstance(data['email'], str):
             return jsonify({"error": "Missing required field: email (must be a string)"}), 400
-        
+
         email_address = data['email'].strip()
         if not email_address:
             return jsonify({"error": "Email cannot be empty"}), 400
-        
+
         # Basic email validation
-        import re
-        if not re.match(r'^[^\s@]+@[^\s@]+\.[^\s@]+$', email_address):
+        if not valid_email(email_address):
             return jsonify({"error": "Invalid email format"}), 400
-        
-        conn = get_db_connection()
-        if not conn:
-            return jsonify({"error": "Database connection failed"}), 500
-        
-        cur = conn.cursor()
-        
-        # Check if user already has an emails record
-        cur.execute("""
-            SELECT id, emails 
-            FROM group_bill_automation.bill_automator_emails 
-            WHERE user_id = %s
-        """, (request.user_id,))
-        
-        existing_record = cur.fetchone()
-        
-        if existing_record:
-            # Check if email already exists in the array
-            existing_emails = existing_record[1] or []
-            if email_address in existing_emails:
-                cur.close()
-                conn.close()
-                return jsonify({"error": "Email already exists"}), 409
-            
-            # Add email to existing array
-            updated_emails = existing_emails + [email_address]
-            cur.execute("""
-                UPDATE group_bill_automation.bill_automator_emails 
-                SET emails = %s 
-                WHERE user_id = %s
-                RETURNING id, emails
-            """, (updated_emails, request.user_id))
-        else:
-            # Create new record with single email
+
+        with db_cursor() as cur:
+            # Create the record or append to it; the WHERE makes the update a no-op (no row returned) for duplicates
             cur.execute("""
-                INSERT INTO group_bill_automation.bill_automator_emails (user_id, emails)
+                INSERT INTO group_bill_automation.bill_automator_emails AS e (user_id, emails)
                 VALUES (%s, %s)
+                ON CONFLICT (user_id) DO UPDATE
+                SET emails = array_append(coalesce(e.emails, '{}'), EXCLUDED.emails[1])
+                WHERE NOT (EXCLUDED.emails[1] = ANY(coalesce(e.emails, '{}')))
                 RETURNING id, emails
             """, (request.user_id, [email_address]))
-        
-        email_data = cur.fetchone()
-        conn.commit()
-        
-        cur.close()
-        conn.close()
-        
+
+            email_data = cur.fetchone()
+
+        if not email_data:
+            return jsonify({"error": "Email already exists"}), 409
+
+        invalidate_user_cache(request.user_id)
+
         return jsonify({
             "message": "Email added successfully",
             "emails": email_data[1]
         }), 200
-    
+
     except Exception as e:
         return jsonify({"error": str(e)}), 500
 
@@ -1038,75 +1074,45 @@ def add_email():
 @require_auth
 def save_family_mappings():
     """Save phone line to family mappings for the authenticated user."""
-    
+
     try:
         data = request.get_json()
-        print(f"Received mappings data: {data}")
-        
+        app.logger.debug("Received mappings data: %s", data)
+
         if not data or 'mappings' not in data or not isinstance(data['mappings'], list):
             return jsonify({"error": "Missing required field: mappings (must be an array)"}), 400
-        
+
         # Validate that each mapping has required fields
         for i, mapping in enumerate(data['mappings']):
-            print(f"Validating mapping {i}: {mapping}")
             if not isinstance(mapping, dict):
                 return jsonify({"error": f"Mapping {i} is not a dictionary: {mapping}"}), 400
             if 'family_id' not in mapping:
                 return jsonify({"error": f"Mapping {i} missing family_id field: {mapping}"}), 400
             if 'line_id' not in mapping:
                 return jsonify({"error": f"Mapping {i} missing line_id field: {mapping}"}), 400
-            if not mapping['family_id']:
-                return jsonify({"error": f"Mapping {i} has empty family_id: {mapping}"}), 400
-            if not mapping['line_id']:
-                return jsonify({"error": f"Mapping {i} has empty line_id: {mapping}"}), 400
-        
-        conn = get_db_connection()
-        if not conn:
-            return jsonify({"error": "Database connection failed"}), 500
-        
-        cur = conn.cursor()
-        
-        # Get existing mappings to avoid duplicates
-        cur.execute("""
-            SELECT family_id, line_id 
-            FROM group_bill_automation.bill_automator_family_mapping 
-            WHERE family_id IN (
-                SELECT id FROM group_bill_automation.bill_automator_families 
-                WHERE user_id = %s
-            )
-        """, (request.user_id,))
-        
-        existing_mappings = set()
-        for row in cur.fetchall():
-            existing_mappings.add((row[0], row[1]))
-        
-        # Insert new mappings, avoiding duplicates
-        inserted_count = 0
-        for mapping in data['mappings']:
-            family_id = mapping['family_id']
-            line_id = mapping['line_id']
-            
-            if (family_id, line_id) not in existing_mappings:
-                cur.execute("""
-                    INSERT INTO group_bill_automation.bill_automator_family_mapping 
-                    (family_id, line_id) 
-                    VALUES (%s, %s)
-                """, (family_id, line_id))
-                inserted_count += 1
-            else:
-                # Mapping already exists, skip
-                pass
-        
-        conn.commit()
-        cur.close()
-        conn.close()
-        
+            if not mapping['family_id']:
+                return jsonify({"error": f"Mapping {i} has empty family_id: {mapping}"}), 400
+            if not mapping['line_id']:
+                return jsonify({"error": f"Mapping {i} has empty line_id: {mapping}"}), 400
+
+        with db_cursor() as cur:
+            # Insert all mappings at once; pairs that already exist are skipped by the unique constraint
+            inserted = execute_values(cur, """
+                INSERT INTO group_bill_automation.bill_automator_family_mapping (family_id, line_id)
+                VALUES %s
+                ON CONFLICT (family_id, line_id) DO NOTHING
+                RETURNING 1
+            """, [(mapping['family_id'], mapping['line_id']) for mapping in data['mappings']], fetch=True)
+            inserted_count = len(inserted)
+
+        invalidate_user_cache(request.user_id)
+
         return jsonify({
             "message": f"Family mappings saved successfully ({inserted_count} new mappings added)",
             "mappings_count": len(data['mappings']),
             "inserted_count": inserted_count
         }), 200
-    
+
     except Exception as e:
         return jsonify({"error": str(e)}), 500
 
@@ -1114,35 +1120,21 @@ def save_family_mappings():
 @require_auth
 def get_lines():
     """Get all available phone lines for the authenticated user."""
-    
+
+    def load_lines():
+        with db_cursor(RealDictCursor) as cur:
+            cur.execute("""
+                SELECT id, name, number, device, created_at
+                FROM group_bill_automation.bill_automator_lines
+                WHERE user_id = %s
+                ORDER BY id
+            """, (request.user_id,))
+
+            return {"lines": cur.fetchall()}
+
     try:
-        conn = get_db_connection()
-        if not conn:
-            return jsonify({"error": "Database connection failed"}), 500
-        
-        cur = conn.cursor()
-        cur.execute("""
-            SELECT id, name, number, device, created_at
-            FROM group_bill_automation.bill_automator_lines 
-            WHERE user_id = %s
-            ORDER BY id
-        """, (request.user_id,))
-        
-        lines = []
-        for line in cur.fetchall():
-            lines.append({
-                "id": line[0],
-                "name": line[1],
-                "number": line[2],
-                "device": line[3],
-                "created_at": line[4].isoformat() if line[4] else None
-            })
-        
-        cur.close()
-        conn.close()
-        
-        return jsonify({"lines": lines})
-    
+        return conditional_json(cached_user_data('lines', request.user_id, load_lines))
+
     except Exception as e:
         return jsonify({"error": str(e)}), 500
 
@@ -1262,77 +1254,36 @@ def parse_pdf():
         if pdf_file.filename == '':
             return jsonify({"error": "No PDF file selected"}), 400
         
-        # Read the PDF file
-        pdf_bytes = pdf_file.read()
-        
-        # Parse the PDF using the updated extract_charges_from_pdf function
-        account_wide_value, line_details = extract_charges_from_pdf(pdf_bytes)
-        
-        # Get existing lines from database for this user
-        conn = get_db_connection()
-        if not conn:
-            return jsonify({"error": "Database connection failed"}), 500
-        
-        cur = conn.cursor()
-        cur.execute("""
-            SELECT id, name, number, device
-            FROM group_bill_automation.bill_automator_lines 
-            WHERE user_id = %s
-        """, (request.user_id,))
+        # Parse the upload stream directly rather than copying it into a bytes object first
+        account_wide_value, line_details = extract_charges_cached(pdf_file.stream)
         
+        # Look up only the parsed (name, number) pairs among this user's saved lines;
+        # an empty or unrecognized bill has nothing to match, so skip the database entirely
         existing_lines = {}
-        for line in cur.fetchall():
-            # Create a composite key using name and number only
-            composite_key = f"{line[1]}|{line[2]}"  # name|number
-            existing_lines[composite_key] = {
-                "id": line[0],
-                "name": line[1],
-                "number": line[2],
-                "device": line[3],
-                "exists": True
-            }
-        
-        cur.close()
-        conn.close()
-        
-        print(f"=== MANUAL PROCESS DEBUG ===")
-        print(f"Account-wide value from PDF: {account_wide_value}")
-        print(f"Number of line details from PDF: {len(line_details)}")
-        print(f"Number of existing lines from DB: {len(existing_lines)}")
-        
-        # Check specific line IDs that might be missing
-        print(f"\n--- CHECKING SPECIFIC LINE IDs IN MANUAL PROCESS ---")
-        conn = get_db_connection()
-        cur = conn.cursor()
-        cur.execute("""
-            SELECT fm.id, fm.family_id, fm.line_id, f.family, l.name as line_name, l.number as line_number
-            FROM group_bill_automation.bill_automator_family_mapping fm
-            JOIN group_bill_automation.bill_automator_families f ON fm.family_id = f.id
-            JOIN group_bill_automation.bill_automator_lines l ON fm.line_id = l.id
-            WHERE f.user_id = %s AND fm.line_id IN (55, 60)
-            ORDER BY fm.line_id
-        """, (request.user_id,))
-        
-        specific_mappings = cur.fetchall()
-        print(f"Specific mappings for line_id 55 and 60:")
-        for mapping in specific_mappings:
-            print(f"  mapping_id={mapping[0]}, family_id={mapping[1]}, line_id={mapping[2]}, family_name='{mapping[3]}', line_name='{mapping[4]}', line_number='{mapping[5]}'")
-        
-        cur.close()
-        conn.close()
-        
-        # Print all existing lines from database
-        print(f"\n--- EXISTING LINES FROM DATABASE ---")
-        for composite_key, line_data in existing_lines.items():
-            print(f"DB Line: key='{composite_key}', id={line_data['id']}, name='{line_data['name']}', number='{line_data['number']}', device='{line_data['device']}'")
-        
-        # Print all parsed lines from PDF
-        print(f"\n--- PARSED LINES FROM PDF ---")
-        for line_key, line_data in line_details.items():
-            print(f"PDF Line: name='{line_data.get('name')}', number='{line_data.get('number')}', device='{line_data.get('device')}', charge={line_data.get('charge')}")
-        
+        if line_details:
+            with db_cursor(RealDictCursor) as cur:
+                cur.execute("""
+                    SELECT l.id, l.name, l.number, l.device
+                    FROM unnest(%s::text[], %s::text[]) AS t(name, number)
+                    JOIN group_bill_automation.bill_automator_lines l
+                      ON l.user_id = %s AND l.name = t.name AND l.number = t.number
+                """, (
+                    [line_detail["name"] for line_detail in line_details.values()],
+                    [line_detail["number"] for line_detail in line_details.values()],
+                    request.user_id
+                ))
+
+                for line in cur.fetchall():
+                    # Key by name and number only
+                    existing_lines[f"{line['name']}|{line['number']}"] = line
+        
+        app.logger.debug("parse-pdf: account_wide_value=%s parsed_lines=%s existing_lines=%s",
+                         account_wide_value, len(line_details), len(existing_lines))
+
         # Process parsed line details and check against existing lines (without saving)
         parsed_lines = []
+        existing_count = 0
+        total_charge = 0
 
         for unique_key, line_detail in line_details.items():
             name = line_detail["name"]
@@ -1345,17 +1296,8 @@ def parse_pdf():
 
             exists = parsed_composite_key in existing_lines and number != 'Unknown'
 
-            print(f"\n--- CHECKING LINE: {name}|{number} ---")
-            print(f"Looking for composite key: '{parsed_composite_key}'")
-            print(f"Found in existing_lines: {parsed_composite_key in existing_lines}")
-            print(f"Number is 'Unknown': {number == 'Unknown'}")
-            print(f"Final exists result: {exists}")
-            
-            if parsed_composite_key in existing_lines:
-                print(f"  Found existing line: {existing_lines[parsed_composite_key]}")
-
             line_data = {
-                "unique_key": unique_key,
+                "unique_key": " | ".join(unique_key),
                 "name": name,
                 "number": number,
                 "device": device,
@@ -1368,88 +1310,83 @@ def parse_pdf():
                 # Reference existing line
                 existing_line = existing_lines[parsed_composite_key]
                 line_data["id"] = existing_line["id"]
-            
+                existing_count += 1
+
+            total_charge += charge
             parsed_lines.append(line_data)
         
-        print(f"\n--- SUMMARY ---")
-        print(f"Total parsed lines: {len(parsed_lines)}")
-        print(f"Existing lines found: {len([line for line in parsed_lines if line['exists']])}")
-        print(f"New lines to save: {len([line for line in parsed_lines if not line['exists']])}")
-        print(f"Total charge: ${sum(line['charge'] for line in parsed_lines)}")
-        print(f"=== END MANUAL PROCESS DEBUG ===")
-        
         return jsonify({
             "success": True,
             "lines": parsed_lines,
-            "existing_lines_count": len([line for line in parsed_lines if line["exists"]]),
-            "new_lines_count": len([line for line in parsed_lines if not line["exists"]]),
-            "total_charge": sum(line["charge"] for line in parsed_lines),
+            "existing_lines_count": existing_count,
+            "new_lines_count": len(parsed_lines) - existing_count,
+            "total_charge": total_charge,
             "account_wide_value": account_wide_value
         })
     
     except Exception as e:
-        print(f"Error parsing PDF: {e}")
+        app.logger.exception("Error parsing PDF")
         return jsonify({"error": str(e)}), 500
 
 @app.route('/api/save-selected-lines', methods=['POST'])
 @require_auth
 def save_selected_lines():
     """Save only the selected lines to the database."""
-    
+
     try:
         data = request.get_json()
         if not data or 'lines' not in data or not isinstance(data['lines'], list):
             return jsonify({"error": "Missing required field: lines (must be an array)"}), 400
-        
-        conn = get_db_connection()
-        if not conn:
-            return jsonify({"error": "Database connection failed"}), 500
-        
-        cur = conn.cursor()
+
         saved_lines = []
-        
+        new_lines = []
         for line in data['lines']:
             if line.get('selected', False) and not line.get('exists', False):
-                # Only save new lines that are selected
-                cur.execute("""
-                    INSERT INTO group_bill_automation.bill_automator_lines 
-                    (user_id, name, number, device, created_at, updated_at)
-                    VALUES (%s, %s, %s, %s, NOW(), NOW())
-                    RETURNING id
-                """, (request.user_id, line['name'], line['number'], line['device']))
-                
-                line_id = cur.fetchone()[0]
-                
-                # If line has a family assigned, create the family mapping
-                if line.get('family'):
-                    family_id = line['family']
-                    cur.execute("""
-                        INSERT INTO group_bill_automation.bill_automator_family_mapping 
-                        (family_id, line_id) 
-                        VALUES (%s, %s)
-                    """, (family_id, line_id))
-                
-                saved_lines.append({
-                    **line,
-                    "id": line_id,
-                    "exists": True
-                })
+                # Only save new lines that are selected; the id is filled in after the insert
+                new_line = {**line, "exists": True}
+                new_lines.append(new_line)
+                saved_lines.append(new_line)
             elif line.get('exists', False):
                 # Keep existing lines as they are
                 saved_lines.append(line)
-        
-        conn.commit()
-        cur.close()
-        conn.close()
-        
+
+        if new_lines:
+            with db_cursor() as cur:
+                inserted = execute_values(cur, """
+                    INSERT INTO group_bill_automation.bill_automator_lines
+                    (user_id, name, number, device, created_at, updated_at)
+                    VALUES %s
+                    RETURNING id, name, number, device
+                """, [(request.user_id, line['name'], line['number'], line['device']) for line in new_lines],
+                    template="(%s, %s, %s, %s, NOW(), NOW())", fetch=True)
+
+                # RETURNING order is not guaranteed, so match rows back on (name, number, device);
+                # identical duplicate lines share a key and take its ids in turn
+                lines_by_key = defaultdict(list)
+                for new_line in new_lines:
+                    lines_by_key[(new_line['name'], new_line['number'], new_line['device'])].append(new_line)
+                for line_id, name, number, device in inserted:
+                    lines_by_key[(name, number, device)].pop()["id"] = line_id
+
+                # Create the family mapping for every new line that has a family assigned
+                mapping_rows = [(line['family'], line['id']) for line in new_lines if line.get('family')]
+                if mapping_rows:
+                    execute_values(cur, """
+                        INSERT INTO group_bill_automation.bill_automator_family_mapping
+                        (family_id, line_id)
+                        VALUES %s
+                    """, mapping_rows)
+
+        invalidate_user_cache(request.user_id)
+
         return jsonify({
             "success": True,
             "saved_lines": saved_lines,
             "message": f"Saved {len([line for line in saved_lines if not line.get('was_existing', False)])} new lines"
         })
-    
+
     except Exception as e:
-        print(f"Error saving selected lines: {e}")
+        app.logger.exception("Error saving selected lines")
         return jsonify({"error": str(e)}), 500
 
 
@@ -1457,41 +1394,25 @@ def save_selected_lines():
 @require_auth
 def get_family_mappings():
     """Get existing family mappings for the authenticated user."""
-    
+
+    def load_mappings():
+        with db_cursor(RealDictCursor) as cur:
+            cur.execute("""
+                SELECT fm.id, fm.family_id, fm.line_id, f.family as family_name, l.name as line_name, l.number as line_number, l.device as line_device
+                FROM group_bill_automation.bill_automator_family_mapping fm
+                JOIN group_bill_automation.bill_automator_families f ON fm.family_id = f.id
+                JOIN group_bill_automation.bill_automator_lines l ON fm.line_id = l.id
+                WHERE f.user_id = %s
+                ORDER BY fm.id
+            """, (request.user_id,))
+
+            return {"mappings": cur.fetchall()}
+
     try:
-        conn = get_db_connection()
-        if not conn:
-            return jsonify({"error": "Database connection failed"}), 500
-        
-        cur = conn.cursor()
-        cur.execute("""
-            SELECT fm.id, fm.family_id, fm.line_id, f.family, l.name as line_name, l.number as line_number, l.device as line_device
-            FROM group_bill_automation.bill_automator_family_mapping fm
-            JOIN group_bill_automation.bill_automator_families f ON fm.family_id = f.id
-            JOIN group_bill_automation.bill_automator_lines l ON fm.line_id = l.id
-            WHERE f.user_id = %s
-            ORDER BY fm.id
-        """, (request.user_id,))
-        
-        mappings = []
-        for mapping in cur.fetchall():
-            mappings.append({
-                "id": mapping[0],
-                "family_id": mapping[1],
-                "line_id": mapping[2],
-                "family_name": mapping[3],
-                "line_name": mapping[4],
-                "line_number": mapping[5],
-                "line_device": mapping[6]
-            })
-        
-        cur.close()
-        conn.close()
-        
-        return jsonify({"mappings": mappings})
-    
+        return conditional_json(cached_user_data('family_mappings', request.user_id, load_mappings))
+
     except Exception as e:
-        print(f"Error getting family mappings: {e}")
+        app.logger.exception("Error getting family mappings")
         return jsonify({"error": str(e)}), 500
 
 
@@ -1499,83 +1420,69 @@ def get_family_mappings():
 @require_auth
 def get_accountwide_reconciliation():
     """Get account-wide reconciliation for the authenticated user."""
-    
-    try:
-        conn = get_db_connection()
-        if not conn:
-            return jsonify({"error": "Database connection failed"}), 500
-        
-        cur = conn.cursor()
-        cur.execute("""
-            SELECT reconciliation 
-            FROM group_bill_automation.bill_automator_accountwide_reconciliation 
-            WHERE user_id = %s
-        """, (request.user_id,))
-        
-        result = cur.fetchone()
-        cur.close()
-        conn.close()
-        
+
+    def load_reconciliation():
+        with db_cursor() as cur:
+            cur.execute("""
+                SELECT reconciliation
+                FROM group_bill_automation.bill_automator_accountwide_reconciliation
+                WHERE user_id = %s
+            """, (request.user_id,))
+
+            result = cur.fetchone()
+
         if result:
-            return jsonify({
+            return {
                 "success": True,
                 "reconciliation": result[0]
-            })
+            }
         else:
-            return jsonify({
+            return {
                 "success": False,
                 "reconciliation": None
-            })
-    
+            }
+
+    try:
+        return conditional_json(cached_user_data('reconciliation', request.user_id, load_reconciliation))
+
     except Exception as e:
-        print(f"Error getting account-wide reconciliation: {e}")
+        app.logger.exception("Error getting account-wide reconciliation")
         return jsonify({"error": str(e)}), 500
 
 @app.route('/api/accountwide-reconciliation', methods=['POST'])
 @require_auth
 def save_accountwide_reconciliation():
     """Save account-wide reconciliation settings for the authenticated user."""
-    
+
     try:
         data = request.get_json()
         if not data or 'reconciliation' not in data:
             return jsonify({"error": "Missing required field: reconciliation"}), 400
-        
+
         reconciliation = data['reconciliation']
-        
-        conn = get_db_connection()
-        if not conn:
-            return jsonify({"error": "Database connection failed"}), 500
-        
-        cur = conn.cursor()
-        
-        # Delete any existing reconciliation for this user
-        cur.execute("""
-            DELETE FROM group_bill_automation.bill_automator_accountwide_reconciliation 
-            WHERE user_id = %s
-        """, (request.user_id,))
-        
-        # Insert new reconciliation
-        cur.execute("""
-            INSERT INTO group_bill_automation.bill_automator_accountwide_reconciliation 
-            (user_id, reconciliation) 
-            VALUES (%s, %s)
-            RETURNING id
-        """, (request.user_id, reconciliation))
-        
-        reconciliation_id = cur.fetchone()[0]
-        conn.commit()
-        cur.close()
-        conn.close()
-        
+
+        with db_cursor() as cur:
+            # Create or replace this user's reconciliation setting
+            cur.execute("""
+                INSERT INTO group_bill_automation.bill_automator_accountwide_reconciliation
+                (user_id, reconciliation)
+                VALUES (%s, %s)
+                ON CONFLICT (user_id) DO UPDATE SET reconciliation = EXCLUDED.reconciliation
+                RETURNING id
+            """, (request.user_id, reconciliation))
+
+            reconciliation_id = cur.fetchone()[0]
+
+        invalidate_user_cache(request.user_id)
+
         return jsonify({
             "success": True,
             "message": "Account-wide reconciliation saved successfully",
             "reconciliation_id": reconciliation_id
         })
-    
+
     except Exception as e:
-        print(f"Error saving account-wide reconciliation: {e}")
+        app.logger.exception("Error saving account-wide reconciliation")
         return jsonify({"error": str(e)}), 500
 
 
@@ -1583,123 +1490,97 @@ def save_accountwide_reconciliation():
 @require_auth
 def get_line_discount_transfer():
     """Get line discount transfer for the authenticated user."""
-    
-    try:
-        conn = get_db_connection()
-        if not conn:
-            return jsonify({"error": "Database connection failed"}), 500
-        
-        cur = conn.cursor()
-        cur.execute("""
-            SELECT transfer_amount, line_to_remove_from, line_to_add_to
-            FROM group_bill_automation.bill_automator_line_discount_transfer_adjustment 
-            WHERE user_id = %s
-            ORDER BY created_at DESC
-            LIMIT 1
-        """, (request.user_id,))
-        
-        result = cur.fetchone()
-        cur.close()
-        conn.close()
-        
+
+    def load_transfer():
+        with db_cursor() as cur:
+            cur.execute("""
+                SELECT transfer_amount, line_to_remove_from, line_to_add_to
+                FROM group_bill_automation.bill_automator_line_discount_transfer_adjustment
+                WHERE user_id = %s
+                ORDER BY created_at DESC
+                LIMIT 1
+            """, (request.user_id,))
+
+            result = cur.fetchone()
+
         if result:
-            return jsonify({
+            return {
                 "success": True,
                 "transfer": {
                     "transfer_amount": result[0],
                     "line_to_remove_from": result[1],
                     "line_to_add_to": result[2]
                 }
-            })
+            }
         else:
-            return jsonify({
+            return {
                 "success": False,
                 "transfer": None
-            })
-    
+            }
+
+    try:
+        return conditional_json(cached_user_data('line_transfer', request.user_id, load_transfer))
+
     except Exception as e:
-        print(f"Error getting line discount transfer: {e}")
+        app.logger.exception("Error getting line discount transfer")
         return jsonify({"error": str(e)}), 500
 
 @app.route('/api/line-discount-transfer', methods=['POST'])
 @require_auth
 def save_line_discount_transfer():
     """Save line discount transfer adjustment for the authenticated user."""
-    
+
     try:
         data = request.get_json()
         if not data or 'transfer_amount' not in data or 'line_to_remove_from' not in data or 'line_to_add_to' not in data:
             return jsonify({"error": "Missing required fields: transfer_amount, line_to_remove_from, line_to_add_to"}), 400
-        
+
         transfer_amount = float(data['transfer_amount'])
         line_to_remove_from = int(data['line_to_remove_from'])
         line_to_add_to = int(data['line_to_add_to'])
-        
+
         if transfer_amount <= 0:
             return jsonify({"error": "Transfer amount must be greater than 0"}), 400
-        
+
         if line_to_remove_from == line_to_add_to:
             return jsonify({"error": "Cannot transfer to the same line"}), 400
-        
-        conn = get_db_connection()
-        if not conn:
-            return jsonify({"error": "Database connection failed"}), 500
-        
-        cur = conn.cursor()
-        
-        # Verify that both lines exist and belong to this user
-        cur.execute("""
-            SELECT id FROM group_bill_automation.bill_automator_lines 
-            WHERE id IN (%s, %s) AND user_id = %s
-        """, (line_to_remove_from, line_to_add_to, request.user_id))
-        
-        lines = cur.fetchall()
-        if len(lines) != 2:
-            return jsonify({"error": "One or both lines not found or do not belong to user"}), 400
-        
-        # Check if an existing transfer exists for this user with the same remove/add lines
-        cur.execute("""
-            SELECT id FROM group_bill_automation.bill_automator_line_discount_transfer_adjustment 
-            WHERE user_id = %s AND line_to_remove_from = %s AND line_to_add_to = %s
-        """, (request.user_id, line_to_remove_from, line_to_add_to))
-        
-        existing_transfer = cur.fetchone()
-        
-        if existing_transfer:
-            # Update existing transfer
-            cur.execute("""
-                UPDATE group_bill_automation.bill_automator_line_discount_transfer_adjustment 
-                SET transfer_amount = %s, updated_at = NOW()
-                WHERE id = %s
-            """, (transfer_amount, existing_transfer[0]))
-            
-            transfer_id = existing_transfer[0]
-            message = "Line discount transfer updated successfully"
-        else:
-            # Insert new transfer
+
+        with db_cursor() as cur:
+            # Verify both lines belong to this user and create or update the transfer in one statement;
+            # no row comes back when the ownership check fails
             cur.execute("""
-                INSERT INTO group_bill_automation.bill_automator_line_discount_transfer_adjustment 
-                (user_id, transfer_amount, line_to_remove_from, line_to_add_to) 
-                VALUES (%s, %s, %s, %s)
-                RETURNING id
-            """, (request.user_id, transfer_amount, line_to_remove_from, line_to_add_to))
-            
-            transfer_id = cur.fetchone()[0]
-            message = "Line discount transfer saved successfully"
-        conn.commit()
-        cur.close()
-        conn.close()
-        
+                WITH owned AS (
+                    SELECT COUNT(*) AS line_count FROM group_bill_automation.bill_automator_lines
+                    WHERE id IN (%(remove_from)s, %(add_to)s) AND user_id = %(user_id)s
+                )
+                INSERT INTO group_bill_automation.bill_automator_line_discount_transfer_adjustment
+                (user_id, transfer_amount, line_to_remove_from, line_to_add_to)
+                SELECT %(user_id)s, %(amount)s, %(remove_from)s, %(add_to)s FROM owned WHERE line_count = 2
+                ON CONFLICT (user_id, line_to_remove_from, line_to_add_to) DO UPDATE
+                SET transfer_amount = EXCLUDED.transfer_amount, updated_at = NOW()
+                RETURNING id, (xmax = 0) AS inserted
+            """, {'user_id': request.user_id, 'amount': transfer_amount,
+                  'remove_from': line_to_remove_from, 'add_to': line_to_add_to})
+
+            transfer = cur.fetchone()
+            if not transfer:
+                return jsonify({"error": "One or both lines not found or do not belong to user"}), 400
+
+            transfer_id, inserted = transfer
+            message = "Line discount transfer saved successfully" if inserted else "Line discount transfer updated successfully"
+
+        invalidate_user_cache(request.user_id)
+
         return jsonify({
             "success": True,
             "message": message,
             "transfer_id": transfer_id
         })
-    
+
     except ValueError:
         return jsonify({"error": "Invalid transfer amount"}), 400
     except Exception as e:
-        print(f"Error saving line discount transfer: {e}")
+        app.logger.exception("Error saving line discount transfer")
         return jsonify({"error": str(e)}), 500
 
 @app.route('/api/send-bill-emails', methods=['POST'])
@@ -1722,41 +1603,17 @@ def send_bill_emails():
         line_adjustments = data.get('line_adjustments')
         account_wide_value = data.get('account_wide_value')
         
-        # Get user's email addresses
-        conn = get_db_connection()
-        if not conn:
-            return jsonify({"error": "Database connection failed"}), 500
-        
-        cur = conn.cursor()
-        
-        # Get user's email
-        cur.execute("""
-            SELECT email FROM group_bill_automation.bill_automator_users 
-            WHERE id = %s
-        """, (request.user_id,))
-        
-        user_email_record = cur.fetchone()
-        if not user_email_record:
-            cur.close()
-            conn.close()
+        # Get the sender and recipient emails from the (cached) automation configuration
+        config = cached_user_data('automation_config', request.user_id, lambda: load_automation_config(request.user_id))
+
+        user_email = config['user_email']
+        if not user_email:
             return jsonify({"error": "User not found"}), 404
-        
-        user_email = user_email_record[0]
-        
-        # Get user's email addresses
-        cur.execute("""
-            SELECT emails FROM group_bill_automation.bill_automator_emails 
-            WHERE user_id = %s
-        """, (request.user_id,))
-        
-        email_record = cur.fetchone()
-        cur.close()
-        conn.close()
-        
-        if not email_record or not email_record[0]:
+
+        if not config['emails']:
             return jsonify({"error": "No email addresses configured for this user"}), 400
         
-        email_list = email_record[0]
+        email_list = config['emails']
         
         # Convert family totals to the format expected by parse_verizon
         # The parse_verizon functions expect person_totals as a dict
@@ -1767,16 +1624,22 @@ def send_bill_emails():
                 total_amount = float(family_total['total'])
                 person_totals[family_name] = total_amount
         
-        # Import parse_verizon functions
-        import parse_verizon
-        
-        # Send the email using the existing functionality with user's email list
+        # Send (or queue) the email using the existing functionality with user's email list
         # If detailed data is provided, use it for detailed breakdown
         if line_details and family_mappings:
-            parse_verizon.send_email(person_totals, email_list, user_email, line_details, family_mappings, line_adjustments, account_wide_value)
+            task_id = send_bill_email(person_totals, email_list, user_email, line_details, family_mappings, line_adjustments, account_wide_value)
         else:
-            parse_verizon.send_email(person_totals, email_list, user_email)
+            task_id = send_bill_email(person_totals, email_list, user_email)
         
+        if task_id:
+            return jsonify({
+                "success": True,
+                "message": f"Bill emails queued for {len(email_list)} recipients",
+                "emails_sent": len(email_list),
+                "family_totals": family_totals,
+                "task_id": task_id
+            }), 202
+
         return jsonify({
             "success": True,
             "message": f"Bill emails sent successfully to {len(email_list)} recipients",
@@ -1785,10 +1648,54 @@ def send_bill_emails():
         })
     
     except Exception as e:
-        print(f"Error sending bill emails: {e}")
+        app.logger.exception("Error sending bill emails")
         return jsonify({"error": str(e)}), 500
 
 
+# Helper function to load everything automated processing needs for a user
+def load_automation_config(user_id):
+    """Load the sender email, recipient list, family mappings, line adjustments and reconciliation setting."""
+    with db_cursor() as cur:
+        cur.execute("""
+            SELECT jsonb_build_object(
+                'user_email', (
+                    SELECT u.email
+                    FROM group_bill_automation.bill_automator_users u
+                    WHERE u.id = %(user_id)s
+                ),
+                'emails', (
+                    SELECT to_jsonb(e.emails)
+                    FROM group_bill_automation.bill_automator_emails e
+                    WHERE e.user_id = %(user_id)s
+                    LIMIT 1
+                ),
+                'family_mappings', (
+                    SELECT coalesce(jsonb_agg(jsonb_build_array(
+                        f.id, f.family, fm.line_id, l.name, l.number, l.device
+                    ) ORDER BY f.id, fm.id), '[]'::jsonb)
+                    FROM group_bill_automation.bill_automator_families f
+                    LEFT JOIN group_bill_automation.bill_automator_family_mapping fm ON f.id = fm.family_id
+                    LEFT JOIN group_bill_automation.bill_automator_lines l ON fm.line_id = l.id
+                    WHERE f.user_id = %(user_id)s
+                ),
+                'line_adjustments', (
+                    SELECT coalesce(jsonb_agg(jsonb_build_array(
+                        a.transfer_amount, a.line_to_remove_from, a.line_to_add_to
+                    )), '[]'::jsonb)
+                    FROM group_bill_automation.bill_automator_line_discount_transfer_adjustment a
+                    WHERE a.user_id = %(user_id)s
+                ),
+                'reconciliation', (
+                    SELECT r.reconciliation
+                    FROM group_bill_automation.bill_automator_accountwide_reconciliation r
+                    WHERE r.user_id = %(user_id)s
+                    LIMIT 1
+                )
+            )
+        """, {'user_id': user_id})
+
+        return cur.fetchone()[0]
+
 @app.route('/api/automated_process', methods=['POST'])
 @require_auth
 def automated_process():
@@ -1803,97 +1710,25 @@ def automated_process():
         if pdf_file.filename == '':
             return jsonify({"error": "No PDF file selected"}), 400
         
-        # Get user's complete configuration from database
-        conn = get_db_connection()
-        if not conn:
-            return jsonify({"error": "Database connection failed"}), 500
-        
-        cur = conn.cursor()
-        
-        # Get user's families and line mappings
-        cur.execute("""
-            SELECT f.id, f.family, fm.line_id, l.name as line_name, l.number as line_number, l.device as line_device
-            FROM group_bill_automation.bill_automator_families f
-            LEFT JOIN group_bill_automation.bill_automator_family_mapping fm ON f.id = fm.family_id
-            LEFT JOIN group_bill_automation.bill_automator_lines l ON fm.line_id = l.id
-            WHERE f.user_id = %s
-            ORDER BY f.id, fm.id
-        """, (request.user_id,))
-        
-        family_mappings = cur.fetchall()
-        
-        print(f"=== AUTOMATED PROCESSING DEBUG ===")
-        print(f"Raw family mappings query results:")
-        for i, mapping in enumerate(family_mappings):
-            print(f"  {i}: family_id={mapping[0]}, family_name='{mapping[1]}', line_id={mapping[2]}, line_name='{mapping[3]}', line_number='{mapping[4]}', line_device='{mapping[5]}'")
-        
-        # Check specific line IDs that might be missing
-        print(f"\n--- CHECKING SPECIFIC LINE IDs ---")
-        cur.execute("""
-            SELECT fm.id, fm.family_id, fm.line_id, f.family, l.name as line_name, l.number as line_number
-            FROM group_bill_automation.bill_automator_family_mapping fm
-            JOIN group_bill_automation.bill_automator_families f ON fm.family_id = f.id
-            JOIN group_bill_automation.bill_automator_lines l ON fm.line_id = l.id
-            WHERE f.user_id = %s AND fm.line_id IN (55, 60)
-            ORDER BY fm.line_id
-        """, (request.user_id,))
-        
-        specific_mappings = cur.fetchall()
-        print(f"Specific mappings for line_id 55 and 60:")
-        for mapping in specific_mappings:
-            print(f"  mapping_id={mapping[0]}, family_id={mapping[1]}, line_id={mapping[2]}, family_name='{mapping[3]}', line_name='{mapping[4]}', line_number='{mapping[5]}'")
-        
-        # Get user's emails
-        cur.execute("""
-            SELECT emails FROM group_bill_automation.bill_automator_emails 
-            WHERE user_id = %s
-        """, (request.user_id,))
-        
-        email_record = cur.fetchone()
-        if not email_record or not email_record[0]:
+        # Get user's complete configuration in a single round trip, served from the cache on repeat runs
+        config = cached_user_data('automation_config', request.user_id, lambda: load_automation_config(request.user_id))
+
+        # Rows come back as JSON arrays; keep the tuple shape the totals code and send_email unpack
+        family_mappings = [tuple(mapping) for mapping in config['family_mappings']]
+        line_adjustments = [tuple(adjustment) for adjustment in config['line_adjustments']]
+        account_wide_reconciliation = config['reconciliation']
+
+        emails = config['emails']  # This is already a list of email addresses
+        if not emails:
             return jsonify({
                 "error": "No email addresses configured",
                 "message": "Please configure email addresses before using automated processing"
             }), 400
-        
-        emails = email_record[0]  # This is already a list of email addresses
-        
-        # Get user's email for sender
-        cur.execute("""
-            SELECT email FROM group_bill_automation.bill_automator_users 
-            WHERE id = %s
-        """, (request.user_id,))
-        
-        user_email_record = cur.fetchone()
-        if not user_email_record:
-            cur.close()
-            conn.close()
+
+        user_email = config['user_email']
+        if not user_email:
             return jsonify({"error": "User not found"}), 404
-        
-        user_email = user_email_record[0]
-        
-        # Get user's line adjustments (discount transfers)
-        cur.execute("""
-            SELECT transfer_amount, line_to_remove_from, line_to_add_to
-            FROM group_bill_automation.bill_automator_line_discount_transfer_adjustment 
-            WHERE user_id = %s
-        """, (request.user_id,))
-        
-        line_adjustments = cur.fetchall()
-        
-        # Get user's account-wide reconciliation
-        cur.execute("""
-            SELECT reconciliation
-            FROM group_bill_automation.bill_automator_accountwide_reconciliation 
-            WHERE user_id = %s
-        """, (request.user_id,))
-        
-        reconciliation_record = cur.fetchone()
-        account_wide_reconciliation = reconciliation_record[0] if reconciliation_record else None
-        
-        cur.close()
-        conn.close()
-        
+
         # Check if user has complete configuration
         if not family_mappings:
             return jsonify({
@@ -1902,146 +1737,108 @@ def automated_process():
             }), 400
         
         # Step 1: Parse the PDF using the same approach as parse_verizon.py
-        import tempfile
-        import os
+        # Extract charges using the same approach as parse_verizon.py
+        account_wide_value, line_details = extract_charges_cached(pdf_file.stream)
         
-        # Read the PDF file into bytes (same as parse-pdf endpoint)
-        pdf_bytes = pdf_file.read()
+        # Step 2: Calculate family totals based on line mappings
+        family_totals = defaultdict(float)
         
-        try:
-            # Import parse_verizon functions
-            import parse_verizon
-            
-            # Extract charges using the same approach as parse_verizon.py
-            account_wide_value, line_details = extract_charges_from_pdf(pdf_bytes)
-            
-            # Step 2: Calculate family totals based on line mappings
-            family_totals = {}
-            
-            print(f"=== AUTOMATED PROCESSING DEBUG ===")
-            print(f"Account-wide value from PDF: {account_wide_value}")
-            print(f"Number of line details from PDF: {len(line_details)}")
-            print(f"Number of family mappings from DB: {len(family_mappings)}")
-            
-            # Print all parsed lines from PDF
-            print(f"\n--- PARSED LINES FROM PDF ---")
-            for line_key, line_data in line_details.items():
-                print(f"PDF Line: name='{line_data.get('name')}', number='{line_data.get('number')}', device='{line_data.get('device')}', charge={line_data.get('charge')}")
-            
-            # Print all family mappings from database
-            print(f"\n--- FAMILY MAPPINGS FROM DATABASE ---")
-            for family_id, family_name, line_id, line_name, line_number, line_device in family_mappings:
-                print(f"DB Mapping: family='{family_name}', name='{line_name}', number='{line_number}', device='{line_device}', line_id={line_id}")
-            
-            # Group charges by family based on line mappings
+        app.logger.debug("automated-process: account_wide_value=%s pdf_lines=%s family_mappings=%s",
+                         account_wide_value, len(line_details), len(family_mappings))
+
+        # Dump the parsed lines and saved mappings only when debug logging is on
+        if app.logger.isEnabledFor(logging.DEBUG):
+            for line_data in line_details.values():
+                app.logger.debug("PDF Line: name='%s', number='%s', device='%s', charge=%s", line_data.get('name'), line_data.get('number'), line_data.get('device'), line_data.get('charge'))
             for family_id, family_name, line_id, line_name, line_number, line_device in family_mappings:
-                if family_name not in family_totals:
-                    family_totals[family_name] = 0
-                
-                print(f"\n--- CHECKING FAMILY: {family_name} ---")
-                print(f"Looking for: name='{line_name}', number='{line_number}'")
-                
-                # Find charges for this line by matching name and number
-                for line_key, line_data in line_details.items():
-                    pdf_name = line_data.get('name')
-                    pdf_number = line_data.get('number')
-                    pdf_charge = line_data.get('charge', 0)
-                    
-                    print(f"  Comparing with PDF: name='{pdf_name}', number='{pdf_number}', charge={pdf_charge}")
-                    
-                    if (pdf_name == line_name and pdf_number == line_number):
-                        print(f"  ✅ MATCH FOUND! Adding {pdf_charge} to {family_name}")
-                        family_totals[family_name] += pdf_charge
-                    else:
-                        print(f"  ❌ NO MATCH")
-            
-            print(f"\n--- FAMILY TOTALS BEFORE ADJUSTMENTS ---")
-            for family_name, total in family_totals.items():
-                print(f"{family_name}: ${total}")
-            
-            # Step 3: Apply line adjustments (discount transfers)
-            print(f"\n--- LINE ADJUSTMENTS ---")
-            print(f"Number of line adjustments: {len(line_adjustments)}")
+                app.logger.debug("DB Mapping: family='%s', name='%s', number='%s', device='%s', line_id=%s", family_name, line_name, line_number, line_device, line_id)
+        
+        # Sum the PDF charges per (name, number) once so each mapping is a single lookup
+        line_charges = defaultdict(float)
+        for line_data in line_details.values():
+            line_charges[(line_data.get('name'), line_data.get('number'))] += line_data.get('charge', 0)
+
+        # Group charges by family based on line mappings
+        for family_id, family_name, line_id, line_name, line_number, line_device in family_mappings:
+            # Find charges for this line by matching name and number; a family with no match still gets a 0.0 total
+            charge = line_charges.get((line_name, line_number))
+            if charge is None:
+                app.logger.debug("No PDF charge for %s line name='%s', number='%s'", family_name, line_name, line_number)
+            family_totals[family_name] += charge or 0.0
+        
+        app.logger.debug("Family totals before adjustments: %s", family_totals)
+        
+        # Step 3: Apply line adjustments (discount transfers)
+        # Index which families each line is mapped to so every transfer is two lookups
+        line_families = {}
+        for family_id, family_name, line_id, line_name, line_number, line_device in family_mappings:
+            if line_id is not None:
+                line_families.setdefault(line_id, []).append(family_name)
+
+        # Amounts arrive as JSON numbers from the configuration query, so no Decimal conversion is needed
+        for transfer_amount, line_to_remove_from, line_to_add_to in line_adjustments:
+            app.logger.debug("Processing transfer: $%s from line_id=%s to line_id=%s", transfer_amount, line_to_remove_from, line_to_add_to)
             
-            for transfer_amount, line_to_remove_from, line_to_add_to in line_adjustments:
-                # Convert decimal to float for arithmetic operations
-                transfer_amount_float = float(transfer_amount)
-                print(f"Processing transfer: ${transfer_amount_float} from line_id={line_to_remove_from} to line_id={line_to_add_to}")
-                
-                # Find which family the lines belong to
-                for family_id, family_name, line_id, line_name, line_number, line_device in family_mappings:
-                    if line_id == line_to_remove_from:
-                        print(f"  Removing ${transfer_amount_float} from {family_name}")
-                        family_totals[family_name] -= transfer_amount_float
-                    elif line_id == line_to_add_to:
-                        print(f"  Adding ${transfer_amount_float} to {family_name}")
-                        family_totals[family_name] += transfer_amount_float
-            
-            # Step 4: Apply account-wide reconciliation if configured
-            print(f"\n--- ACCOUNT-WIDE RECONCILIATION ---")
-            print(f"Reconciliation value: {account_wide_reconciliation}")
-            
-            if account_wide_reconciliation:
-                if account_wide_reconciliation == "evenly":
-                    # Distribute account-wide charges/credits equally among families
-                    num_families = len(set(f[1] for f in family_mappings))  # unique family names
-                    if num_families > 0:
-                        per_family_share = account_wide_value / num_families
-                        print(f"Distributing account-wide value (${account_wide_value}) evenly among {num_families} families: ${per_family_share} each")
-                        for family_name in family_totals:
-                            print(f"  Adding ${per_family_share} to {family_name}")
-                            family_totals[family_name] += per_family_share
-                else:
-                    # Try to parse as a numeric value
-                    try:
-                        account_wide_amount = float(account_wide_reconciliation)
-                        # Distribute account-wide amount equally among families
-                        num_families = len(set(f[1] for f in family_mappings))  # unique family names
-                        if num_families > 0:
-                            per_family_share = account_wide_amount / num_families
-                            print(f"Distributing reconciliation amount (${account_wide_amount}) evenly among {num_families} families: ${per_family_share} each")
-                            for family_name in family_totals:
-                                print(f"  Adding ${per_family_share} to {family_name}")
-                                family_totals[family_name] += per_family_share
-                    except ValueError:
-                        # If reconciliation is not a valid number, skip it
-                        print(f"Reconciliation value '{account_wide_reconciliation}' is not a valid number, skipping")
-                        pass
-            else:
-                print("No account-wide reconciliation configured")
-            
-            # Step 5: Send emails using the existing functionality
+            for family_name in line_families.get(line_to_remove_from, []):
+                family_totals[family_name] -= transfer_amount
+            for family_name in line_families.get(line_to_add_to, []):
+                family_totals[family_name] += transfer_amount
+        
+        # Step 4: Apply account-wide reconciliation if configured
+        account_wide_amount = None
+        if account_wide_reconciliation == "evenly":
+            # Distribute account-wide charges/credits equally among families
+            account_wide_amount = account_wide_value
+        elif account_wide_reconciliation:
+            # Try to parse as a numeric value
             try:
-                # Convert family totals to the format expected by parse_verizon.send_email
-                person_totals = family_totals  # The function can handle family names as person names
-                
-                # Send email using the existing functionality with detailed breakdown
-                parse_verizon.send_email(person_totals, emails, user_email, line_details, family_mappings, line_adjustments, account_wide_value)
-                
-            except Exception as e:
-                return jsonify({"error": f"Failed to send emails: {str(e)}"}), 500
-            
-            total_amount = sum(family_totals.values())
-            
-            print(f"\n--- FINAL FAMILY TOTALS ---")
-            for family_name, total in family_totals.items():
-                print(f"{family_name}: ${total}")
-            print(f"Total amount: ${total_amount}")
-            print(f"=== END AUTOMATED PROCESSING DEBUG ===")
+                account_wide_amount = float(account_wide_reconciliation)
+            except ValueError:
+                # If reconciliation is not a valid number, skip it
+                app.logger.debug("Reconciliation value '%s' is not a valid number, skipping", account_wide_reconciliation)
+        else:
+            app.logger.debug("No account-wide reconciliation configured")
+
+        # family_totals has exactly one entry per unique family name
+        num_families = len(family_totals)
+        if account_wide_amount is not None and num_families > 0:
+            per_family_share = account_wide_amount / num_families
+            app.logger.debug("Distributing $%s evenly among %s families: $%s each", account_wide_amount, num_families, per_family_share)
+            family_totals = {family_name: total + per_family_share for family_name, total in family_totals.items()}
+        
+        family_totals = dict(family_totals)
+
+        # Step 5: Send emails using the existing functionality
+        try:
+            # Convert family totals to the format expected by parse_verizon.send_email
+            person_totals = family_totals  # The function can handle family names as person names
             
-            return jsonify({
-                "success": True,
-                "message": "Bill processed and emails sent successfully",
-                "family_totals": family_totals,
-                "emails_sent": len(emails),
-                "total_amount": total_amount,
-                "account_wide_value": account_wide_value,
-                "line_adjustments_applied": len(line_adjustments),
-                "account_wide_reconciliation_applied": account_wide_reconciliation is not None
-            })
+            # Send (or queue) the email using the existing functionality with detailed breakdown
+            task_id = send_bill_email(person_totals, emails, user_email, line_details, family_mappings, line_adjustments, account_wide_value)
             
         except Exception as e:
-            raise e
+            return jsonify({"error": f"Failed to send emails: {str(e)}"}), 500
+        
+        total_amount = sum(family_totals.values())
+        
+        app.logger.debug("Final family totals: %s (total $%s)", family_totals, total_amount)
+        
+        result = {
+            "success": True,
+            "message": "Bill processed and emails sent successfully",
+            "family_totals": family_totals,
+            "emails_sent": len(emails),
+            "total_amount": total_amount,
+            "account_wide_value": account_wide_value,
+            "line_adjustments_applied": len(line_adjustments),
+            "account_wide_reconciliation_applied": account_wide_reconciliation is not None
+        }
+        if task_id:
+            result["message"] = "Bill processed and emails queued"
+            result["task_id"] = task_id
+            return jsonify(result), 202
+
+        return jsonify(result)
     
     except Exception as e:
         return jsonify({"error": str(e)}), 500
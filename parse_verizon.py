@@ -1,5 +1,6 @@
 import fitz  # PyMuPDF
 from collections import defaultdict
+import io
 import os
 import re
 from glob import glob
@@ -33,12 +34,28 @@ email_list = [
     "djs.siegel@gmail.com",
 ]
 
+# Patterns compiled once at import instead of on every lookup in the parse loops
+PHONE_RE = re.compile(r'\(?\d{3}\)?[-.\s]?\d{3}[-.\s]?\d{4}')
+MYBILL_RE = re.compile(r"MyBill_(\d{2})\.(\d{2})\.(\d{4})\.pdf")
+# A charge record is four consecutive lines: name, amount ("$12.34" or "-$5.00"), device, phone number.
+# The whole pattern is a lookahead so matches can overlap, exactly like walking the lines one by one
+RECORD_RE = re.compile(r'^(?=([^\n]*)\n([^\S\n]*(?:\$|-\$\d)[^\n]*)\n([^\n]*)\n([^\n]*))', re.MULTILINE)
+
+# Loose address check shared by the API's add-email route and send_email
+def valid_email(address):
+    """Return True for something@something.tld with a single @ and no whitespace."""
+    local, at, domain = address.partition('@')
+    if not local or not at or '@' in domain:
+        return False
+    # The domain needs a dot with at least one character on each side of it
+    return '.' in domain[1:-1] and not any(ch.isspace() for ch in address)
+
 def get_latest_mybill_pdf(folder="./verizon-bills"):
     pdf_files = glob(os.path.join(folder, "MyBill_*.pdf"))
     dated_files = []
 
     for file in pdf_files:
-        match = re.search(r"MyBill_(\d{2})\.(\d{2})\.(\d{4})\.pdf", os.path.basename(file))
+        match = MYBILL_RE.search(os.path.basename(file))
         if match:
             mm, dd, yyyy = match.groups()
             try:
@@ -53,52 +70,67 @@ def get_latest_mybill_pdf(folder="./verizon-bills"):
     latest_file = max(dated_files, key=lambda x: x[0])[1]
     return latest_file
 
+def open_pdf(source):
+    """Open a PDF given a file path, raw bytes, or a binary file-like object such as an upload stream."""
+    if isinstance(source, (str, os.PathLike)):
+        return fitz.open(source)
+    if isinstance(source, (bytes, bytearray)):
+        return fitz.open("pdf", source)
+    if isinstance(source, io.BytesIO):
+        # PyMuPDF reads in-memory streams directly
+        return fitz.open(stream=source, filetype="pdf")
+    if isinstance(getattr(source, "name", None), str) and os.path.isfile(source.name):
+        # Files on disk (e.g. a large upload spooled to a named temp file) are read by MuPDF without a copy
+        return fitz.open(source.name, filetype="pdf")
+    return fitz.open("pdf", source.read())
+
 def extract_charges_from_pdf(pdf_path):
-    print(f'Extracting charges from {pdf_path}')
-    doc = fitz.open("pdf", pdf_path)
+    if isinstance(pdf_path, (str, os.PathLike)):
+        print(f'Extracting charges from {pdf_path}')
+    # Pages are read sequentially: PyMuPDF holds the GIL and a Document must not be shared across threads.
+    # Closing it right after extracting the text frees MuPDF's native buffers before the lines are parsed
+    with open_pdf(pdf_path) as doc:
+        page_texts = [page.get_text("text") for page in doc]
     
     account_wide_value = 0.0
     line_details = {}
 
-    phone_pattern = r'\(?\d{3}\)?[-.\s]?\d{3}[-.\s]?\d{4}'
-
-    for page in doc:
-        lines = page.get_text("text").split("\n")
-
-        for i in range(1, len(lines) - 2):  # need room for i+2
-            line = lines[i].strip()
-
-            if line.startswith("$") or re.match(r"^-?\$\d", line):
-                prev_line = lines[i - 1].strip()
-                try:
-                    amount = float(line.replace("$", "").replace(",", ""))
-
-                    if prev_line == "Account-wide charges & credits":
-                        account_wide_value = amount
-                    else:
-                        # Only consider if i+2 has a phone number
-                        candidate = lines[i + 2].strip()
-                        phone_match = re.search(phone_pattern, candidate)
+    for page_text in page_texts:
+        for record in RECORD_RE.finditer(page_text):
+            prev_line, line, device, candidate = (part.strip() for part in record.groups())
+            try:
+                amount = float(line.replace("$", "").replace(",", ""))
+            except ValueError:
+                continue
 
-                        if phone_match:
-                            number = phone_match.group()
-                            device = lines[i + 1].strip()
+            if prev_line == "Account-wide charges & credits":
+                account_wide_value = amount
+                continue
 
-                            # Create a unique key using name + device + number
-                            unique_key = f"{prev_line} | {device} | {number}"
+            # Only consider if the line two below the amount has a phone number
+            phone_match = PHONE_RE.search(candidate)
+            if phone_match:
+                number = phone_match.group()
 
-                            line_details[unique_key] = {
-                                "name": prev_line,
-                                "device": device,
-                                "number": number,
-                                "charge": amount
-                            }
+                # Create a unique key using name + device + number
+                unique_key = (prev_line, device, number)
 
-                except ValueError:
-                    continue
+                line_details[unique_key] = {
+                    "name": prev_line,
+                    "device": device,
+                    "number": number,
+                    "charge": amount
+                }
 
     return account_wide_value, line_details
 
+def charges_by_line_name(line_details):
+    """Sum the charges in extract_charges_from_pdf's line details by line name."""
+    line_charges = defaultdict(float)
+    for details in line_details.values():
+        line_charges[details["name"]] += details["charge"]
+    return dict(line_charges)
+
 def group_by_person(line_charges):
     person_totals = defaultdict(float)
     for line, amount in line_charges.items():
@@ -119,55 +151,59 @@ def adjust_for_smartwatch_discount(person_totals):
         person_totals["New Roc Siegels"] -= 7
         person_totals["Riverdale Siegels"] += 7
 
-def send_email(person_totals, custom_email_list=None, sender_email=None, line_details=None, family_mappings=None, line_adjustments=None, account_wide_value=None):
+# Shared Sendinblue client, created on first send; reusing it keeps its HTTPS connections alive between emails
+_email_api = None
+
+def get_email_api():
+    """Return the shared Sendinblue transactional email client."""
+    global _email_api
+    if _email_api is None:
+        configuration = Configuration()
+        configuration.api_key['api-key'] = os.getenv('SENDINBLUE_API_KEY')
+        _email_api = TransactionalEmailsApi(ApiClient(configuration))
+    return _email_api
+
+def build_email_html(person_totals, line_details=None, family_mappings=None, line_adjustments=None, account_wide_value=None):
+    """Build the bill email body, with a per-family line breakdown when line_details and family_mappings are given."""
     breakdown_message = generate_messages(person_totals)
     total_cost = sum(person_totals.values())
-    
-    # Configure API key authorization
-    configuration = Configuration()
-    configuration.api_key['api-key'] = os.getenv('SENDINBLUE_API_KEY')
-
-    api_instance = TransactionalEmailsApi(ApiClient(configuration))
 
     # Build detailed breakdown if line_details and family_mappings are provided
     detailed_breakdown = ""
     if line_details and family_mappings:
-        detailed_breakdown = "<br/><br/><strong>Detailed Breakdown:</strong><br/>"
+        parts = ["<br/><br/><strong>Detailed Breakdown:</strong><br/>"]
         
-        # Group line details by family
+        # Index the PDF lines by name and number once so each mapping is a single lookup
+        pdf_lines = {}
+        for line_data in line_details.values():
+            pdf_lines.setdefault((line_data.get('name'), line_data.get('number')), []).append({
+                'name': line_data.get('name'),
+                'device': line_data.get('device', ''),
+                'number': line_data.get('number'),
+                'charge': line_data.get('charge', 0)
+            })
+
+        # Group line details, and the mapped line ids used for transfers, by family
         family_line_details = {}
+        family_line_ids = {}
         for family_id, family_name, line_id, line_name, line_number, line_device in family_mappings:
-            if family_name not in family_line_details:
-                family_line_details[family_name] = []
-            
-            # Find matching line in line_details
-            for line_key, line_data in line_details.items():
-                pdf_name = line_data.get('name')
-                pdf_number = line_data.get('number')
-                pdf_charge = line_data.get('charge', 0)
-                
-                if (pdf_name == line_name and pdf_number == line_number):
-                    family_line_details[family_name].append({
-                        'name': pdf_name,
-                        'device': line_data.get('device', ''),
-                        'number': pdf_number,
-                        'charge': pdf_charge
-                    })
+            family_line_details.setdefault(family_name, []).extend(pdf_lines.get((line_name, line_number), []))
+            family_line_ids.setdefault(family_name, []).append(line_id)
+
+        # Per-family share of account-wide charges/credits, the same for every family
+        per_family_share = None
+        if account_wide_value is not None and abs(account_wide_value) > 0.01:
+            per_family_share = account_wide_value / len(family_line_details)
         
         # Build detailed breakdown for each family
         for family_name, lines in family_line_details.items():
-            detailed_breakdown += f"<br/><strong>{family_name}:</strong><br/>"
+            parts.append(f"<br/><strong>{family_name}:</strong><br/>")
             for line in lines:
-                detailed_breakdown += f"&nbsp;&nbsp;• {line['name']} ({line['device']}) {line['number']}: ${line['charge']:.2f}<br/>"
+                parts.append(f"&nbsp;&nbsp;• {line['name']} ({line['device']}) {line['number']}: ${line['charge']:.2f}<br/>")
             
             # Add account-wide share if applicable
-            if account_wide_value is not None and abs(account_wide_value) > 0.01:
-                # Calculate per-family share of account-wide charges/credits
-                num_families = len(family_line_details)
-                if num_families > 0:
-                    per_family_share = account_wide_value / num_families
-                    if abs(per_family_share) > 0.01:
-                        detailed_breakdown += f"&nbsp;&nbsp;• Account-wide share: ${per_family_share:.2f}<br/>"
+            if per_family_share is not None and abs(per_family_share) > 0.01:
+                parts.append(f"&nbsp;&nbsp;• Account-wide share: ${per_family_share:.2f}<br/>")
             
             # Add line discount transfers if applicable
             if line_adjustments:
@@ -175,14 +211,15 @@ def send_email(person_totals, custom_email_list=None, sender_email=None, line_de
                     transfer_amount_float = float(transfer_amount)
                     
                     # Check if this family has lines involved in the transfer
-                    for family_id, fam_name, line_id, line_name, line_number, line_device in family_mappings:
-                        if fam_name == family_name:
-                            if line_id == line_to_remove_from:
-                                detailed_breakdown += f"&nbsp;&nbsp;• Transfer out: -${transfer_amount_float:.2f}<br/>"
-                            elif line_id == line_to_add_to:
-                                detailed_breakdown += f"&nbsp;&nbsp;• Transfer in: +${transfer_amount_float:.2f}<br/>"
-
-    html_content = f"""
+                    for line_id in family_line_ids[family_name]:
+                        if line_id == line_to_remove_from:
+                            parts.append(f"&nbsp;&nbsp;• Transfer out: -${transfer_amount_float:.2f}<br/>")
+                        elif line_id == line_to_add_to:
+                            parts.append(f"&nbsp;&nbsp;• Transfer in: +${transfer_amount_float:.2f}<br/>")
+
+        detailed_breakdown = "".join(parts)
+
+    return f"""
     Hey family!<br/><br/>
     
     <strong>Total cost for the month: ${total_cost:.2f}</strong><br/><br/>
@@ -196,26 +233,21 @@ def send_email(person_totals, custom_email_list=None, sender_email=None, line_de
     Pleasure doing business with ya.
     """
 
+def send_email(person_totals, custom_email_list=None, sender_email=None, line_details=None, family_mappings=None, line_adjustments=None, account_wide_value=None):
+    api_instance = get_email_api()
+    html_content = build_email_html(person_totals, line_details, family_mappings, line_adjustments, account_wide_value)
+
     # Use custom email list if provided, otherwise use default
     email_list_to_use = custom_email_list if custom_email_list is not None else email_list
     
     # Use sender email if provided, otherwise use default
     sender_email_to_use = sender_email if sender_email is not None else "caleb.siegel@gmail.com"
     
-    # Clean and validate email addresses
-    
-    # Clean and validate email addresses
-    cleaned_emails = []
-    for email in email_list_to_use:
-        # Remove trailing commas and whitespace
-        cleaned_email = email.strip().rstrip(',')
-        # Basic email validation
-        if '@' in cleaned_email and '.' in cleaned_email and len(cleaned_email) > 5:
-            cleaned_emails.append(cleaned_email)
-        else:
-            print(f"Invalid email address skipped: {email}")
-    
-    to_list = [{"email": email} for email in cleaned_emails]
+    # Clean (remove trailing commas and whitespace) and validate email addresses
+    cleaned_emails = [email.strip().rstrip(',') for email in email_list_to_use]
+    to_list = [{"email": email} for email in cleaned_emails if valid_email(email)]
+    if len(to_list) != len(cleaned_emails):
+        print(f"Invalid email addresses skipped: {[email for email in cleaned_emails if not valid_email(email)]}")
     print(f"Cleaned email list: {to_list}")
 
     send_smtp_email = SendSmtpEmail(
@@ -230,17 +262,17 @@ def send_email(person_totals, custom_email_list=None, sender_email=None, line_de
         print(f"Email sent successfully")
     except ApiException as e:
         print(f"Error sending email: {e}")
-        raise e
+        raise
 
 if __name__ == "__main__":
     pdf_path = get_latest_mybill_pdf("verizon-bills")
-    charges, account_wide_value = extract_charges_from_pdf(pdf_path)
-    person_totals = group_by_person(charges)
+    account_wide_value, line_details = extract_charges_from_pdf(pdf_path)
+    person_totals = defaultdict(float, group_by_person(charges_by_line_name(line_details)))
     unique_people = set(line_to_person.values())
     if unique_people and account_wide_value != 0.0:
         per_person_share = account_wide_value / len(unique_people)
         for person in unique_people:
-            person_totals[person] = person_totals.get(person, 0.0) + per_person_share
+            person_totals[person] += per_person_share
     else:
         print("No account-wide charges & credits to distribute or no unique people found.")
     adjust_for_smartwatch_discount(person_totals)
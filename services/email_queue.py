@@ -0,0 +1,33 @@
+"""
+Email queue for bill emails
+Hands parse_verizon.send_email to an RQ worker when REDIS_URL is configured,
+otherwise sends inline so local development needs no worker
+"""
+
+import os
+from typing import Optional
+
+import parse_verizon
+from redis import Redis
+from rq import Queue, Retry
+
+# Jobs wait on this queue for `rq worker emails --url $REDIS_URL --with-scheduler`;
+# the scheduler is what re-enqueues retries after their interval
+EMAIL_QUEUE_NAME = 'emails'
+
+email_queue = Queue(EMAIL_QUEUE_NAME, connection=Redis.from_url(os.getenv('REDIS_URL'))) if os.getenv('REDIS_URL') else None
+
+def send_bill_email(*args) -> Optional[str]:
+    """
+    Send a bill email with parse_verizon.send_email's arguments
+
+    Returns:
+        The RQ job id when the email was queued, or None when it was sent inline
+    """
+    if email_queue is None:
+        parse_verizon.send_email(*args)
+        return None
+
+    # Sendinblue hiccups are retried by the worker instead of failing the request
+    job = email_queue.enqueue(parse_verizon.send_email, *args, retry=Retry(max=3, interval=[10, 30, 60]))
+    return job.id
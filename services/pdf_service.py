@@ -3,8 +3,6 @@ PDF Service for parsing Verizon bills
 This service integrates with the existing parse_verizon.py functionality
 """
 
-import os
-import tempfile
 from typing import Dict, Tuple, List
 import parse_verizon
 from werkzeug.utils import secure_filename
@@ -14,55 +12,45 @@ class PDFService:
     
     def __init__(self, user_id: int = None):
         self.user_id = user_id
+
+    @staticmethod
+    def _serialize_line_details(line_details: Dict) -> Dict:
+        """Convert the parser's (name, device, number) keys into JSON-friendly strings"""
+        return {" | ".join(key): details for key, details in line_details.items()}
     
     def parse_verizon_bill(self, pdf_file, user_config: Dict = None) -> Dict:
         """
         Parse a Verizon bill PDF using the existing parse_verizon logic
         
         Args:
-            pdf_file: Uploaded PDF file
+            pdf_file: Uploaded PDF file, or a path, bytes or binary file-like object
             user_config: User-specific configuration (line mappings, etc.)
             
         Returns:
             Dict containing parsed bill information
         """
         try:
-            # Save uploaded file temporarily
-            with tempfile.NamedTemporaryFile(delete=False, suffix='.pdf') as temp_file:
-                pdf_file.save(temp_file.name)
-                temp_path = temp_file.name
-            
-            try:
-                # Extract charges using enhanced parse_verizon logic
-                account_wide_value, line_details = parse_verizon.extract_charges_from_pdf(temp_path)
-                
-                # Group by person (this could be customized based on user_config)
-                person_totals = parse_verizon.group_by_person(line_details)
-                
-                # Apply smartwatch discount if applicable
-                parse_verizon.adjust_for_smartwatch_discount(person_totals)
-                
-                # Calculate total
-                total_cost = sum(person_totals.values())
-                
-                # Clean up temporary file
-                os.unlink(temp_path)
-                
-                return {
-                    'success': True,
-                    'line_details': line_details,
-                    'person_totals': person_totals,
-                    'account_wide_value': account_wide_value,
-                    'total_cost': total_cost,
-                    'message': 'PDF parsed successfully'
-                }
-                
-            except Exception as e:
-                # Clean up temporary file on error
-                if os.path.exists(temp_path):
-                    os.unlink(temp_path)
-                raise e
-                
+            # Parse straight from the upload stream; Werkzeug has already spooled large uploads to disk
+            account_wide_value, line_details = parse_verizon.extract_charges_from_pdf(getattr(pdf_file, 'stream', pdf_file))
+
+            # Group by person (this could be customized based on user_config)
+            person_totals = parse_verizon.group_by_person(parse_verizon.charges_by_line_name(line_details))
+
+            # Apply smartwatch discount if applicable
+            parse_verizon.adjust_for_smartwatch_discount(person_totals)
+
+            # Calculate total
+            total_cost = sum(person_totals.values())
+
+            return {
+                'success': True,
+                'line_details': self._serialize_line_details(line_details),
+                'person_totals': person_totals,
+                'account_wide_value': account_wide_value,
+                'total_cost': total_cost,
+                'message': 'PDF parsed successfully'
+            }
+
         except Exception as e:
             return {
                 'success': False,
@@ -72,18 +60,18 @@ class PDFService:
     def get_bill_breakdown(self, pdf_path: str) -> Dict:
         """
         Get bill breakdown from a PDF file path
-        This is a simpler method for when you already have the PDF file path
+        This is a simpler method for when you already have the PDF file path (raw bytes also work)
         """
         try:
             account_wide_value, line_details = parse_verizon.extract_charges_from_pdf(pdf_path)
-            person_totals = parse_verizon.group_by_person(line_details)
+            person_totals = parse_verizon.group_by_person(parse_verizon.charges_by_line_name(line_details))
             parse_verizon.adjust_for_smartwatch_discount(person_totals)
             
             total_cost = sum(person_totals.values())
             
             return {
                 'success': True,
-                'line_details': line_details,
+                'line_details': self._serialize_line_details(line_details),
                 'person_totals': person_totals,
                 'account_wide_value': account_wide_value,
                 'total_cost': total_cost